@@ -2,33 +2,85 @@ const csrftoken = decodeURIComponent(
   /(?:^|;)\s*csrftoken=([^;]+)/.exec(document.cookie)[1],
 )
 const localStorageKey = "au.com.cmv.open-source.lorikeet.cart-data"
-const COMPATIBLE_VERSION = 2
+const COMPATIBLE_VERSION = 3
 const INCOMPATIBLE_VERSION = 1
 
 var setImmediate = window.setImmediate || (x => window.setTimeout(x, 0))
 
+// Keys of the cart that hold lists of entries, which deltas describe
+// changes to individually
+const DELTA_LIST_FIELDS = [
+  "items",
+  "adjustments",
+  "delivery_addresses",
+  "payment_methods",
+]
+
+/**
+ * Apply a delta returned by the cart endpoint to the cart data it was
+ * calculated against.
+ */
+function applyDelta(cart, delta) {
+  var result = Object.assign({}, cart, delta.changed)
+  result.revision = delta.revision
+  result.compatible_version = delta.compatible_version
+  result.incompatible_version = delta.incompatible_version
+  DELTA_LIST_FIELDS.forEach(key => {
+    var diff = delta[key]
+    if (!diff) {
+      return
+    }
+    var changed = {}
+    diff.changed.forEach(x => {
+      changed[x.url] = x
+    })
+    result[key] = cart[key]
+      .filter(x => diff.removed.indexOf(x.url) == -1)
+      .map(x => changed[x.url] || x)
+      .concat(diff.added)
+  })
+  return result
+}
+
+function randomKey() {
+  var bytes = new Uint8Array(16)
+  window.crypto.getRandomValues(bytes)
+  return Array.from(bytes, x => ("0" + x.toString(16)).slice(-2)).join("")
+}
+
 function apiFetch(url, params, client, expectJson = true) {
   return new Promise((resolveRaw, rejectRaw) => {
     var resolve = function(x) {
-      client && client.reloadCart()
-      resolveRaw(x)
+      if (client && x && typeof x == "object" && "cart" in x && "result" in x) {
+        // We asked for the updated cart to be sent back with the result, so
+        // there's no need to load it again
+        client.processReceivedCart(x.cart)
+        resolveRaw(x.result)
+      } else {
+        client && client.reloadCart()
+        resolveRaw(x)
+      }
     }
     var reject = function(x) {
       client && client.reloadCart()
       rejectRaw(x)
     }
     var actualParams = Object.create(params || null)
-    actualParams.headers = Object.create(params ? params.headers || null : null)
+    // Copy the headers, since fetch() ignores inherited properties
+    actualParams.headers = Object.assign({}, params ? params.headers : null)
     actualParams.headers["Accept"] = "application/json"
     actualParams.headers["Content-Type"] = "application/json"
     actualParams.headers["X-CSRFToken"] = csrftoken
+    if (client) {
+      actualParams.headers["X-Lorikeet-Embed"] = "cart"
+    }
     actualParams.credentials = "same-origin"
 
     fetch(url, actualParams).then(
       resp => {
         // Reject the promise if we get a non-2xx return code
         if (resp.ok) {
-          if (expectJson) {
+          if (expectJson || (client && resp.status != 204)) {
             resp.json().then(x => resolve(x))
           } else {
             resp.text().then(x => resolve(x))
@@ -175,9 +227,11 @@ class CartClient {
     // bind all the things
     this.reloadCart = this.reloadCart.bind(this)
     this.addItem = this.addItem.bind(this)
+    this.addItems = this.addItems.bind(this)
     this.addAddress = this.addAddress.bind(this)
     this.addPaymentMethod = this.addPaymentMethod.bind(this)
     this.addAdjustment = this.addAdjustment.bind(this)
+    this.batch = this.batch.bind(this)
     this.checkout = this.checkout.bind(this)
 
     this.cartUrl = cartUrl
@@ -210,13 +264,36 @@ class CartClient {
     })
   }
 
-  reloadCart() {
-    apiFetch(this.cartUrl).then(json => {
-      this.processReceivedCart(json)
+  reloadCart(full) {
+    var headers = { Accept: "application/json" }
+    if (this.cartEtag) {
+      headers["If-None-Match"] = this.cartEtag
+    }
+    var url = this.cartUrl
+    if (!full && this.rawCart && typeof this.rawCart.revision != "undefined") {
+      // Only ask for what's changed since the cart we've got
+      var separator = url.indexOf("?") == -1 ? "?" : "&"
+      url += separator + "since=" + this.rawCart.revision
+    }
+    fetch(url, { headers, credentials: "same-origin" }).then(resp => {
+      // A 304 means the cart hasn't changed since we last loaded it
+      if (resp.ok) {
+        var etag = resp.headers.get("ETag")
+        resp.json().then(json => this.processReceivedCart(json, false, etag))
+      }
     })
   }
 
-  processReceivedCart(cart, receivedFromLocalStorage) {
+  processReceivedCart(cart, receivedFromLocalStorage, etag) {
+    if (cart.delta) {
+      if (!this.rawCart || this.rawCart.revision != cart.since) {
+        // We no longer have the cart this delta applies to
+        this.reloadCart(true)
+        return
+      }
+      cart = applyDelta(this.rawCart, cart)
+    }
+
     // If the cart we recieved is more stale than what we already have, bail
     if (self.cart && self.cart.updated_at > cart.updated_at) {
       return
@@ -245,6 +322,9 @@ class CartClient {
       localStorage.setItem(localStorageKey, JSON.stringify(cart))
     }
 
+    // Keep the data as we received it, to apply later deltas to
+    this.rawCart = Object.assign({}, cart)
+
     // Attach the update method to each member of items
     cart.items = cart.items.map(x => new CartItem(this, x))
     cart.delivery_addresses = cart.delivery_addresses.map(
@@ -256,9 +336,31 @@ class CartClient {
     cart.adjustments = cart.adjustments.map(x => new CartEntry(this, x))
 
     this.cart = cart
+    // Only revalidate against the cart we've actually got
+    this.cartEtag = etag || null
+    this.subscribe()
     this.cartListeners.forEach(x => setImmediate(x.bind(null, this.cart)))
   }
 
+  // Listen for changes made to the cart elsewhere, e.g. on another device.
+  // The server only sends events_url if LORIKEET_CART_EVENTS is enabled.
+  subscribe() {
+    if (
+      !window.EventSource ||
+      !this.cart.events_url ||
+      (this.eventSource && this.eventSource.readyState != EventSource.CLOSED)
+    ) {
+      return
+    }
+    this.eventSource = new EventSource(this.cart.events_url)
+    this.eventSource.onmessage = ev => {
+      var revision = JSON.parse(ev.data).revision
+      if (revision === null || !this.rawCart || this.rawCart.revision < revision) {
+        this.reloadCart()
+      }
+    }
+  }
+
   /**
    * Register a listener function to be called every time the cart is updated.
    * @param {CartClient~cartCallback} listener The listener to add.
@@ -299,6 +401,21 @@ class CartClient {
     return this.add(this.cart.new_item_url, type, data)
   }
 
+  /**
+   * Add several items to the shopping cart in a single request. If any of
+   * them are invalid, none of them are added.
+   * @param {object[]} items - Items to add, each with the type and data
+   *     that addItem takes.
+   */
+  addItems(items) {
+    return this.receiveCart(
+      apiFetch(this.cart.new_items_url, {
+        method: "POST",
+        body: JSON.stringify(items),
+      }),
+    )
+  }
+
   /**
    * Add a delivery address to the shopping cart.
    * @param {string} type - Type of DeliveryAddress to create
@@ -335,18 +452,72 @@ class CartClient {
    * address field.
    */
   setEmail(address) {
-    return apiFetch(
-      this.cartUrl,
-      {
+    return this.receiveCart(
+      apiFetch(this.cartUrl, {
         method: "PATCH",
         body: JSON.stringify({ email: address }),
+      }),
+    )
+  }
+
+  /**
+   * Make several changes to the shopping cart in a single request. If any of
+   * them fail, none of them are made.
+   * @param {object[]} operations - Operations to apply, in order, each with
+   *     an op key naming the endpoint that would otherwise handle it (e.g.
+   *     "new-address"), and the body that endpoint is expecting.
+   */
+  batch(operations) {
+    return this.receiveCart(
+      apiFetch(this.cart.batch_url, {
+        method: "POST",
+        body: JSON.stringify(operations),
+      }),
+    )
+  }
+
+  // The cart and batch endpoints respond with the new state of the cart
+  receiveCart(promise) {
+    return promise.then(
+      cart => {
+        this.processReceivedCart(cart)
+        return cart
+      },
+      err => {
+        this.reloadCart()
+        throw err
       },
-      this,
     )
   }
 
+  /**
+   * Check out the shopping cart. If this fails because of a network error,
+   * calling it again retries the same checkout, so the customer can't be
+   * charged twice.
+   */
   checkout() {
-    return apiFetch(this.cart.checkout_url, { method: "POST" }, this)
+    if (!this.checkoutKey) {
+      this.checkoutKey = randomKey()
+    }
+    var params = {
+      method: "POST",
+      headers: { "Idempotency-Key": this.checkoutKey },
+    }
+    return apiFetch(this.cart.checkout_url, params, this).then(
+      result => {
+        this.checkoutKey = null
+        return result
+      },
+      err => {
+        // Keep the key if we don't know whether the checkout went through.
+        // A 409 means the server is still working on it; the next attempt
+        // gets a new key, so it can't be stuck behind an abandoned one.
+        if (err.reason != "network") {
+          this.checkoutKey = null
+        }
+        throw err
+      },
+    )
   }
 }
 
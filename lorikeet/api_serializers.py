@@ -4,7 +4,8 @@ from time import time
 from django.urls import reverse
 from rest_framework import fields, serializers
 
-from . import models
+from . import models, settings as lorikeet_settings
+from .query_hints import load_subclasses
 
 
 class LineItemSerializerRegistry:
@@ -123,7 +124,15 @@ class LineItemMetadataSerializer(RegistryRelatedWithMetadataSerializer):
     url = fields.SerializerMethodField()
 
     def get_total(self, instance):
-        return str(instance.get_total())
+        if (
+            lorikeet_settings.LORIKEET_STORE_CART_TOTALS
+            and instance.stored_total is not None
+        ):
+            return str(instance.stored_total)
+        pricing = self.context.get("pricing")
+        if pricing is None:
+            return str(instance.total)
+        return str(pricing.get_item_total(instance))
 
     def get_url(self, instance):
         return reverse("lorikeet:cart-item", kwargs={"id": instance.id})
@@ -174,46 +183,78 @@ class AdjustmentSerializer(RegistryRelatedWithMetadataSerializer):
     url = fields.SerializerMethodField()
 
     def get_total(self, instance):
-        # TODO: Store subtotal so that it's only calculated once
-        return str(instance.get_total(instance.cart.get_subtotal()))
+        pricing = self.context.get("pricing") or instance.cart.get_pricing()
+        return str(pricing.get_adjustment_total(instance))
 
     def get_url(self, instance):
         return reverse("lorikeet:adjustment", kwargs={"id": instance.id})
 
 
-class SubclassListSerializer(serializers.ListSerializer):
-    def to_representation(self, instance, *args, **kwargs):
-        instance = instance.select_subclasses()
-        return super().to_representation(instance, *args, **kwargs)
+class CartSerializer(serializers.ModelSerializer):
+    """Serializes the entire state of a cart.
 
+    :param fields: If given, only these fields are included, and nothing
+        needed only by the other fields is calculated. Either a list of
+        field names, or a string of comma-separated names.
+    """
 
-class CartSerializer(serializers.ModelSerializer):
-    items = SubclassListSerializer(child=LineItemMetadataSerializer())
+    items = LineItemMetadataSerializer(many=True, source="get_pricing.items")
     new_item_url = fields.SerializerMethodField()
+    new_items_url = fields.SerializerMethodField()
     subtotal = fields.DecimalField(
-        max_digits=7, decimal_places=2, source="get_subtotal"
+        max_digits=7, decimal_places=2, source="get_totals.subtotal"
     )
     delivery_addresses = fields.SerializerMethodField()
     new_address_url = fields.SerializerMethodField()
     payment_methods = fields.SerializerMethodField()
     new_payment_method_url = fields.SerializerMethodField()
-    adjustments = SubclassListSerializer(child=AdjustmentSerializer())
+    adjustments = AdjustmentSerializer(many=True, source="get_pricing.adjustments")
     new_adjustment_url = fields.SerializerMethodField()
     grand_total = fields.DecimalField(
-        max_digits=7, decimal_places=2, source="get_grand_total"
+        max_digits=7, decimal_places=2, source="get_totals.grand_total"
     )
+    item_count = fields.IntegerField(source="get_totals.item_count")
     is_complete = fields.SerializerMethodField()
     incomplete_reasons = fields.SerializerMethodField()
     is_authenticated = fields.SerializerMethodField()
     checkout_url = fields.SerializerMethodField()
+    batch_url = fields.SerializerMethodField()
+    events_url = fields.SerializerMethodField()
     generated_at = fields.SerializerMethodField()
     email = fields.EmailField()
     compatible_version = fields.SerializerMethodField()
     incompatible_version = fields.SerializerMethodField()
 
+    #: Fields that are always included, so clients can tell whether they
+    #: understand the rest of the data
+    required_fields = ("compatible_version", "incompatible_version")
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            return
+        if isinstance(fields, str):
+            fields = [x.strip() for x in fields.split(",") if x.strip()]
+        unknown = set(fields) - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError(
+                {"fields": ["Unknown fields: {}".format(", ".join(sorted(unknown)))]}
+            )
+        for name in set(self.fields) - set(fields) - set(self.required_fields):
+            self.fields.pop(name)
+
+    def to_representation(self, instance):
+        # Share one pricing snapshot between this serializer and the
+        # nested item and adjustment serializers
+        self.context["pricing"] = instance.get_pricing(use_stored_totals=True)
+        return super().to_representation(instance)
+
     def get_new_item_url(self, _):
         return reverse("lorikeet:add-to-cart")
 
+    def get_new_items_url(self, _):
+        return reverse("lorikeet:add-to-cart-bulk")
+
     def get_new_address_url(self, _):
         return reverse("lorikeet:new-address")
 
@@ -221,10 +262,10 @@ class CartSerializer(serializers.ModelSerializer):
         selected = cart.delivery_address_subclass
         the_set = []
 
-        if cart.user:
-            the_set = cart.user.delivery_addresses.filter(
-                active=True
-            ).select_subclasses()
+        if cart.user_id:
+            the_set = load_subclasses(
+                models.DeliveryAddress.objects.filter(user_id=cart.user_id, active=True)
+            )
 
         if selected is not None and selected not in the_set:
             the_set = chain(the_set, [selected])
@@ -240,10 +281,10 @@ class CartSerializer(serializers.ModelSerializer):
         the_set = []
         selected = cart.payment_method_subclass
 
-        if cart.user:
-            the_set = cart.user.paymentmethod_set.filter(
-                active=True
-            ).select_subclasses()
+        if cart.user_id:
+            the_set = load_subclasses(
+                models.PaymentMethod.objects.filter(user_id=cart.user_id, active=True)
+            )
 
         if selected is not None and selected not in the_set:
             the_set = chain(the_set, [selected])
@@ -262,6 +303,8 @@ class CartSerializer(serializers.ModelSerializer):
         return cart.is_complete()
 
     def get_incomplete_reasons(self, cart):
+        # is_complete might not have been requested, but it's memoised
+        cart.is_complete()
         return cart.errors.to_json()
 
     def get_is_authenticated(self, cart):
@@ -270,8 +313,17 @@ class CartSerializer(serializers.ModelSerializer):
     def get_checkout_url(self, _):
         return reverse("lorikeet:checkout")
 
+    def get_batch_url(self, _):
+        return reverse("lorikeet:batch")
+
+    def get_events_url(self, cart):
+        # There's nothing to watch until the cart is saved
+        if not lorikeet_settings.LORIKEET_CART_EVENTS or cart.pk is None:
+            return None
+        return reverse("lorikeet:events")
+
     def get_compatible_version(self, _):
-        return 2
+        return 3
 
     def get_incompatible_version(self, _):
         return 1
@@ -281,6 +333,7 @@ class CartSerializer(serializers.ModelSerializer):
         fields = (
             "items",
             "new_item_url",
+            "new_items_url",
             "delivery_addresses",
             "new_address_url",
             "payment_methods",
@@ -290,11 +343,15 @@ class CartSerializer(serializers.ModelSerializer):
             "is_complete",
             "incomplete_reasons",
             "checkout_url",
+            "batch_url",
+            "events_url",
             "is_authenticated",
             "email",
             "adjustments",
             "new_adjustment_url",
             "subtotal",
+            "item_count",
+            "revision",
             "compatible_version",
             "incompatible_version",
         )
@@ -325,4 +382,8 @@ class LineItemSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data["cart"] = self.cart
-        return super().create(validated_data)
+        model = self.Meta.model
+        if model.get_merge_key is models.LineItem.get_merge_key:
+            return super().create(validated_data)
+        # Combine the new item with a matching one already in the cart
+        return self.cart.add_items([model(**validated_data)])[0]
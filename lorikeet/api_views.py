@@ -1,18 +1,83 @@
+from datetime import timedelta
 from decimal import Decimal
+from json import dumps
 from logging import getLogger
+from time import monotonic
 
+from django.db.models import Case, Value, When
 from django.db.transaction import atomic
-from django.http import Http404
-from django.utils.module_loading import import_string
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.timezone import now
+from django.views import View
+from django.views.decorators.http import etag
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import CreateAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
 
-from . import api_serializers, exceptions, models, settings, signals
+from . import (
+    api_serializers,
+    cart_deltas,
+    events,
+    exceptions,
+    invoice_ids,
+    models,
+    settings,
+    signals,
+)
+from .async_support import resolve
+from .query_hints import get_subclass
 
 logger = getLogger(__name__)
 
 
+def serialize_cart(request, fields=None, since=None):
+    """Serialize the current request's cart with :class:`CartSerializer`.
+
+    If ``since`` is a revision of the cart that was previously serialized,
+    the result may be a delta against that revision instead; see
+    :mod:`lorikeet.cart_deltas`.
+    """
+    cart = request.get_cart()
+    data = api_serializers.CartSerializer(
+        cart, context={"request": request}, fields=fields
+    ).data
+    if fields is None:
+        cart_deltas.remember_payload(cart.pk, data)
+        if since is not None and cart.pk is not None:
+            delta = cart_deltas.get_delta(cart.pk, data, since)
+            if delta is not None:
+                return delta
+    return data
+
+
+class EmbedCartMixin:
+    """Embed the cart in successful responses, if the client asks for it.
+
+    If the request has an ``X-Lorikeet-Embed: cart`` header or an
+    ``embed=cart`` query parameter, the response body becomes an object
+    with the view's usual response body under ``result``, and the state of
+    the cart after the request under ``cart``, so that the client doesn't
+    need to load the cart again.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        patch_vary_headers(response, ["X-Lorikeet-Embed"])
+        embed = (
+            request.META.get("HTTP_X_LORIKEET_EMBED") == "cart"
+            or request.query_params.get("embed") == "cart"
+        )
+        if embed and isinstance(response, Response) and response.status_code < 300:
+            result = response.data if response.status_code != 204 else None
+            response.data = {"result": result, "cart": serialize_cart(request)}
+            if response.status_code == 204:
+                response.status_code = 200
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
 class NotAuthenticated(Exception):
     """Used for control flow, not for returning an error to the user"""
 
@@ -23,31 +88,149 @@ class InconsistentStateError(Exception):
     pass
 
 
+def cart_etag(request, *args, **kwargs):
+    """Get the ETag for the current request's cart.
+
+    This is derived from the cart's ID and revision, which are looked up
+    on their own rather than loading the whole cart, so that unchanged
+    carts can be revalidated cheaply. Returns ``None`` if the cart hasn't
+    been saved yet.
+    """
+    if hasattr(request, "_cart"):
+        cart_id, revision = request._cart.pk, request._cart.revision
+    elif request.user.is_authenticated:
+        cart_id, revision = (
+            models.Cart.objects.filter(user_id=request.user.pk)
+            .values_list("id", "revision")
+            .first()
+        ) or (None, None)
+    elif "cart_id" in request.session:
+        cart_id = request.session["cart_id"]
+        revision = (
+            models.Cart.objects.filter(id=cart_id)
+            .values_list("revision", flat=True)
+            .first()
+        )
+    else:
+        return None
+
+    if cart_id is None or revision is None:
+        return None
+    return 'W/"{}-{}"'.format(cart_id, revision)
+
+
 class CartView(APIView):
+    @method_decorator(etag(cart_etag))
     def get(self, request, format=None):  # noqa
-        cart = request.get_cart()
-        data = api_serializers.CartSerializer(
-            cart, context={"request": self.request}
-        ).data
-        return Response(data)
+        return self.render_cart(request)
+
+    def render_cart(self, request):
+        since = request.query_params.get("since")
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError({"since": ["Must be a revision number."]})
+        return Response(
+            serialize_cart(
+                request, fields=request.query_params.get("fields"), since=since
+            )
+        )
 
     def patch(self, request, format=None):  # noqa
-        cart = request.get_cart()
         ser = api_serializers.CartUpdateSerializer(
-            instance=cart, data=request.data, partial=True
+            instance=request.get_cart(), data=request.data, partial=True
         )
         ser.is_valid(raise_exception=True)
+        request.get_cart(persist=True)
         ser.save()
-        return self.get(request, format)
+        return self.render_cart(request)
+
+
+class CartEventsView(View):
+    """Stream the cart's revision, each time it changes, as server-sent events.
+
+    The current revision is sent as soon as the stream opens. Each event's
+    data is a JSON object with a ``revision`` key, which is ``null`` if the
+    new revision isn't known.
+
+    This endpoint 404s unless :data:`LORIKEET_CART_EVENTS` is enabled.
+    """
+
+    #: Seconds between the comments sent to keep the connection open
+    keepalive_interval = 15
+    #: Seconds after which the stream ends; ``EventSource`` reconnects
+    #: automatically, and this stops a worker being held indefinitely
+    max_duration = 300
+
+    def get(self, request):
+        if not settings.LORIKEET_CART_EVENTS:
+            raise Http404()
+        cart = request.get_cart()
+        if cart.pk is None:
+            # There's nothing to watch yet; this tells EventSource not to
+            # keep reconnecting
+            return HttpResponse(status=204)
+        response = StreamingHttpResponse(
+            self.stream(cart.pk), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # Stop nginx from buffering the stream
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def stream(self, cart_id):
+        subscription = events.get_bus().subscribe(
+            cart_id, timeout=self.keepalive_interval
+        )
+        try:
+            # Subscribe first, so no change between this and the first
+            # event can be missed
+            yield self.format_event(
+                models.Cart.objects.filter(id=cart_id)
+                .values_list("revision", flat=True)
+                .first()
+            )
+            deadline = monotonic() + self.max_duration
+            for revision in subscription:
+                if revision is events.Subscription.TIMEOUT:
+                    yield ": keepalive\n\n"
+                else:
+                    yield self.format_event(revision)
+                if monotonic() >= deadline:
+                    break
+        finally:
+            subscription.close()
 
+    def format_event(self, revision):
+        return "data: {}\n\n".format(dumps({"revision": revision}))
 
-class CartItemView(RetrieveUpdateDestroyAPIView):
+
+def save_and_select(request, serializer, field_name):
+    """Save a new delivery address or payment method, and select it.
+
+    The new object is assigned to the current user, if there is one, and
+    selected in ``field_name`` on their cart.
+    """
+    if request.user.is_authenticated:
+        serializer.validated_data["user"] = request.user
+    serializer.save()
+    cart = request.get_cart(persist=True)
+    setattr(cart, field_name, serializer.instance)
+    cart.save()
+
+
+class CartItemView(EmbedCartMixin, RetrieveUpdateDestroyAPIView):
     def get_object(self):
         cart = self.request.get_cart()
         try:
-            return cart.items.get_subclass(id=self.kwargs["id"])
+            item = get_subclass(cart.items.all(), id=self.kwargs["id"])
         except models.LineItem.DoesNotExist:
             raise Http404()
+        # Share the request's cart instance, so changes to the item are
+        # reflected on it
+        item.cart = cart
+        return item
 
     def get_serializer(self, instance, *args, **kwargs):
         return api_serializers.LineItemMetadataSerializer(
@@ -55,29 +238,65 @@ class CartItemView(RetrieveUpdateDestroyAPIView):
         )
 
 
-class AddToCartView(CreateAPIView):
+class AddToCartView(EmbedCartMixin, CreateAPIView):
     def get_serializer(self, data, *args, **kwargs):
         ser_class = api_serializers.registry.line_items[data["type"]]
         return ser_class(
             data=data["data"], cart=self.request.get_cart(), *args, **kwargs
         )
 
+    def perform_create(self, serializer):
+        # Only save an anonymous visitor's cart once there's something in it
+        self.request.get_cart(persist=True)
+        serializer.save()
+
 
-class NewAddressView(CreateAPIView):
+class BulkAddToCartView(APIView):
+    """Add a list of items, possibly of different types, to the cart.
+
+    Every item is validated before any of them are saved, and they're all
+    saved in one transaction; the cart's revision and stored totals are
+    updated once for the whole list rather than once per item.
+    """
+
+    def post(self, request, format=None):  # noqa
+        if not isinstance(request.data, list):
+            raise ValidationError("Expected a list of items.")
+
+        cart = request.get_cart()
+        item_serializers = []
+        errors = []
+        for item in request.data:
+            try:
+                ser_class = api_serializers.registry.line_items[item["type"]]
+            except (KeyError, TypeError):
+                item_serializers.append(None)
+                errors.append({"type": ["Unknown item type."]})
+                continue
+            ser = ser_class(data=item.get("data"), cart=cart)
+            item_serializers.append(ser)
+            errors.append({} if ser.is_valid() else ser.errors)
+        if any(errors):
+            return Response({"errors": errors}, status=400)
+
+        request.get_cart(persist=True)
+        with atomic(), cart.defer_changes():
+            for ser in item_serializers:
+                ser.save()
+
+        return Response(serialize_cart(request), status=201)
+
+
+class NewAddressView(EmbedCartMixin, CreateAPIView):
     def get_serializer(self, data, *args, **kwargs):
         ser_class = api_serializers.registry.delivery_addresses[data["type"]]
         return ser_class(data=data["data"], *args, **kwargs)
 
     def perform_create(self, serializer):
-        if self.request.user.is_authenticated:
-            serializer.validated_data["user"] = self.request.user
-        super().perform_create(serializer)
-        cart = self.request.get_cart()
-        cart.delivery_address = serializer.instance
-        cart.save()
+        save_and_select(self.request, serializer, "delivery_address")
 
 
-class NewPaymentMethodView(CreateAPIView):
+class NewPaymentMethodView(EmbedCartMixin, CreateAPIView):
     def get_serializer(self, data, *args, **kwargs):
         ser_class = api_serializers.registry.payment_methods[data["type"]]
         return ser_class(
@@ -85,21 +304,19 @@ class NewPaymentMethodView(CreateAPIView):
         )
 
     def perform_create(self, serializer):
-        if self.request.user.is_authenticated:
-            serializer.validated_data["user"] = self.request.user
-        super().perform_create(serializer)
-        cart = self.request.get_cart()
-        cart.payment_method = serializer.instance
-        cart.save()
+        save_and_select(self.request, serializer, "payment_method")
 
 
-class PaymentMethodView(RetrieveUpdateDestroyAPIView):
+class PaymentMethodView(EmbedCartMixin, RetrieveUpdateDestroyAPIView):
     def get_object(self):
         try:
             if not self.request.user.is_authenticated:
                 raise NotAuthenticated()
-            return models.PaymentMethod.objects.get_subclass(
-                user=self.request.user, id=self.kwargs["id"], active=True,
+            return get_subclass(
+                models.PaymentMethod.objects.all(),
+                user=self.request.user,
+                id=self.kwargs["id"],
+                active=True,
             )
         except (NotAuthenticated, models.PaymentMethod.DoesNotExist):
             cart = self.request.get_cart()
@@ -122,13 +339,16 @@ class PaymentMethodView(RetrieveUpdateDestroyAPIView):
         )
 
 
-class DeliveryAddressView(RetrieveUpdateDestroyAPIView):
+class DeliveryAddressView(EmbedCartMixin, RetrieveUpdateDestroyAPIView):
     def get_object(self):
         try:
             if not self.request.user.is_authenticated:
                 raise NotAuthenticated()
-            return models.DeliveryAddress.objects.get_subclass(
-                user=self.request.user, id=self.kwargs["id"], active=True,
+            return get_subclass(
+                models.DeliveryAddress.objects.all(),
+                user=self.request.user,
+                id=self.kwargs["id"],
+                active=True,
             )
         except (NotAuthenticated, models.DeliveryAddress.DoesNotExist):
             cart = self.request.get_cart()
@@ -151,13 +371,17 @@ class DeliveryAddressView(RetrieveUpdateDestroyAPIView):
         )
 
 
-class AdjustmentView(RetrieveUpdateDestroyAPIView):
+class AdjustmentView(EmbedCartMixin, RetrieveUpdateDestroyAPIView):
     def get_object(self):
         cart = self.request.get_cart()
         try:
-            return cart.adjustments.get_subclass(id=self.kwargs["id"])
+            adjustment = get_subclass(cart.adjustments.all(), id=self.kwargs["id"])
         except models.Adjustment.DoesNotExist:
             raise Http404()
+        # Share the request's cart instance, so changes to the adjustment
+        # are reflected on it
+        adjustment.cart = cart
+        return adjustment
 
     def get_serializer(self, instance, *args, **kwargs):
         return api_serializers.AdjustmentSerializer(
@@ -165,7 +389,7 @@ class AdjustmentView(RetrieveUpdateDestroyAPIView):
         )
 
 
-class NewAdjustmentView(CreateAPIView):
+class NewAdjustmentView(EmbedCartMixin, CreateAPIView):
     def get_serializer(self, data, *args, **kwargs):
         ser_class = api_serializers.registry.adjustments[data["type"]]
         return ser_class(
@@ -173,87 +397,234 @@ class NewAdjustmentView(CreateAPIView):
         )
 
     def perform_create(self, serializer):
-        serializer.save(cart=self.request.get_cart())
+        serializer.save(cart=self.request.get_cart(persist=True))
 
 
-class CheckoutView(APIView):
+class BatchView(APIView):
+    """Apply a list of changes to the cart in a single transaction.
+
+    Each operation is one of the request bodies accepted by the other
+    endpoints, along with an ``op`` key naming the endpoint.
+    """
+
+    #: Maps each ``op`` to the registry its serializers are looked up in
+    registries = {
+        "new": "line_items",
+        "new-address": "delivery_addresses",
+        "new-payment-method": "payment_methods",
+        "new-adjustment": "adjustments",
+    }
+
     def post(self, request, format=None):  # noqa
+        if not isinstance(request.data, list):
+            raise ValidationError("Expected a list of operations.")
+
+        cart = request.get_cart()
+        was_saved = cart.pk is not None
+        index = None
         try:
-            with atomic():
-                # Prepare the order object
-                cart = request.get_cart()
-                subtotal = cart.get_subtotal()
-                grand_total = cart.get_grand_total()
-                order = models.Order.objects.create(
-                    user=cart.user, grand_total=grand_total, guest_email=cart.email
-                )
+            with atomic(), cart.defer_changes():
+                request.get_cart(persist=True)
+                for index, operation in enumerate(request.data):
+                    self.apply(cart, operation)
+        except ValidationError as e:
+            if not was_saved:
+                # The new cart was rolled back along with everything else
+                cart.pk = None
+                request.session.pop("cart_id", None)
+            return Response({"index": index, "errors": e.detail}, status=400)
+
+        return Response(serialize_cart(request))
+
+    def apply(self, cart, operation):
+        op = operation.get("op") if isinstance(operation, dict) else None
+        data = operation.get("data") if op is not None else None
+
+        if op == "update":
+            ser = api_serializers.CartUpdateSerializer(
+                instance=cart, data=data, partial=True
+            )
+            ser.is_valid(raise_exception=True)
+            ser.save()
+            return
+
+        try:
+            registry = getattr(api_serializers.registry, self.registries[op])
+            ser_class = registry[operation["type"]]
+        except KeyError:
+            raise ValidationError("Unknown operation.")
 
-                # Get an invoice ID if required
-                if settings.LORIKEET_INVOICE_ID_GENERATOR is not None:
-                    generator = import_string(settings.LORIKEET_INVOICE_ID_GENERATOR)
-                    order.custom_invoice_id = generator()
+        if op == "new":
+            ser = ser_class(data=data, cart=cart)
+        else:
+            ser = ser_class(data=data, context={"request": self.request})
+        ser.is_valid(raise_exception=True)
 
-                # Check the cart is ready to be checked out
-                cart.is_complete(raise_exc=True, for_checkout=True)
+        if op == "new-address":
+            save_and_select(self.request, ser, "delivery_address")
+        elif op == "new-payment-method":
+            save_and_select(self.request, ser, "payment_method")
+        elif op == "new-adjustment":
+            ser.save(cart=cart)
+        else:
+            ser.save()
+
+
+def move_to_order(model, cart, order, instances, totals):
+    """Move ``instances`` from ``cart`` onto ``order`` in a single query.
+
+    ``model`` is the base class of the instances (e.g. ``LineItem``), and
+    ``totals`` are stored as each instance's ``total_when_charged``. The
+    instances are updated to match, and marked as belonging to a new
+    order so they can still be saved by ``prepare_for_checkout()``.
+    """
+    if not instances:
+        return
+    total_field = model._meta.get_field("total_when_charged")
+    updated = (
+        model.objects.filter(
+            id__in=[x.id for x in instances], cart=cart, order__isnull=True
+        )
+        .order_by()
+        .update(
+            order=order,
+            cart=None,
+            total_when_charged=Case(
+                *(
+                    When(id=x.id, then=Value(total))
+                    for x, total in zip(instances, totals)
+                ),
+                output_field=total_field,
+            ),
+        )
+    )
+    if updated != len(instances):
+        # Something was removed from the cart, or checked out by another
+        # request, after we priced it
+        raise InconsistentStateError(
+            "Expected to move {} {} rows onto order {}, moved {}".format(
+                len(instances), model.__name__, order.id, updated
+            )
+        )
+    for instance, total in zip(instances, totals):
+        instance.order = order
+        instance.cart = None
+        instance.total_when_charged = total
+        instance._new_order = True  # noqa
 
-                items = tuple(cart.items.select_subclasses().all())
-                adjustments = tuple(cart.adjustments.select_subclasses().all())
 
-                # Calculate and store totals
-                running_total = Decimal(0)
-                for item in items:
-                    total = item.get_total()
-                    item.total_when_charged = total
-                    running_total += total
+def move_to_cart(model, order, cart, instances):
+    """Move ``instances`` back from ``order`` into ``cart``.
 
-                if running_total != subtotal:
-                    raise InconsistentStateError()
+    This undoes :func:`move_to_order`, when a two-phase checkout fails.
+    """
+    model.objects.filter(order=order).order_by().update(
+        order=None, cart=cart, total_when_charged=None
+    )
+    for instance in instances:
+        instance.order = None
+        instance.cart = cart
+        instance.total_when_charged = None
+        instance._new_order = False  # noqa
 
-                for adj in adjustments:
-                    total = adj.get_total(subtotal)
-                    adj.total_when_charged = total
-                    running_total += total
-
-                if running_total != grand_total:
-                    raise InconsistentStateError()
-
-                # Copy items and adjustments onto order
-                # We do this in a separate loop because some get_total()
-                # methods (especially on adjustments) might depend on
-                # the state of the rest of the cart, and if we call them
-                # on a half-empty cart, they might not return the
-                # correct result.
-                for item in items:
-                    item.order = order
-                    item.cart = None
-                    item._new_order = True  # noqa
-                    item.save()
-                    item.prepare_for_checkout()
 
-                # copy adjustments onto order
-                for adj in adjustments:
-                    adj.order = order
-                    adj.cart = None
-                    adj._new_order = True  # noqa
-                    adj.save()
-                    adj.prepare_for_checkout()
-
-                # copy delivery address over
-                order.delivery_address = cart.delivery_address
-
-                # make payment and attach it to order
-                order.payment = cart.payment_method_subclass.make_payment(
-                    order, grand_total
-                )
-                print(order.payment)
-                if not isinstance(order.payment, models.Payment):
-                    raise TypeError(
-                        "{}.make_payment() returned {!r}, not a Payment "
-                        "subclass".format(
-                            cart.payment_method.__class__.__name__, order.payment,
-                        )
-                    )
-                order.save()
+def cart_emptied(cart):
+    """Record that the contents of ``cart`` changed all at once."""
+    cart.invalidate_pricing()
+    if settings.LORIKEET_STORE_CART_TOTALS:
+        cart.invalidate_totals()
+    else:
+        cart.bump_revision()
+
+
+class CheckoutView(APIView):
+    #: Seconds after which a checkout made with an ``Idempotency-Key`` that
+    #: still hasn't finished is assumed to have been abandoned (e.g. because
+    #: the worker handling it died), so a retry with the same key can take
+    #: it over rather than getting a 409 forever
+    abandoned_after = 300
+
+    def post(self, request, format=None):  # noqa
+        key = request.META.get("HTTP_IDEMPOTENCY_KEY")
+        if key:
+            return self.post_idempotent(request, key)
+        return self.process(request)
+
+    def post_idempotent(self, request, key):
+        """Check out, unless an earlier request used the same ``key``.
+
+        If one did, its response is sent back instead, or a 409 if it's
+        still in progress. An attempt that's been in progress for longer
+        than :attr:`abandoned_after` is taken over by this request.
+        """
+        max_length = models.CheckoutAttempt._meta.get_field(
+            "idempotency_key"
+        ).max_length
+        if len(key) > max_length:
+            raise ValidationError(
+                "Idempotency-Key must be at most {} characters.".format(max_length)
+            )
+
+        cart = request.get_cart()
+        if cart.pk is None:
+            # There's nothing to check out, or to store the outcome against
+            return self.process(request)
+
+        attempt, created = models.CheckoutAttempt.objects.get_or_create(
+            cart=cart, idempotency_key=key
+        )
+        if not created and attempt.status_code is not None:
+            response = HttpResponse(
+                attempt.response_body,
+                status=attempt.status_code,
+                content_type="application/json",
+            )
+            response["Idempotent-Replayed"] = "true"
+            return response
+        if not created and not self.claim_abandoned(attempt):
+            return Response({"reason": "in_progress"}, status=409)
+
+        try:
+            response = self.process(request)
+        except BaseException:
+            # Let the client try again
+            attempt.delete()
+            raise
+        if response.status_code not in (200, 422):
+            attempt.delete()
+            return response
+
+        attempt.status_code = response.status_code
+        attempt.response_body = dumps(response.data, cls=JSONEncoder)
+        if response.status_code == 200:
+            attempt.order_id = response.data["id"]
+        attempt.save()
+        return response
+
+    def claim_abandoned(self, attempt):
+        """Take over ``attempt``, if it was abandoned while in progress.
+
+        This is done with a single conditional update, so only one of
+        several concurrent retries can succeed. Returns whether it did.
+        """
+        return bool(
+            models.CheckoutAttempt.objects.filter(
+                id=attempt.id,
+                status_code=None,
+                created_on__lt=now() - timedelta(seconds=self.abandoned_after),
+            ).update(created_on=now())
+        )
+
+    def process(self, request):
+        cart = request.get_cart()
+        # Outside of the checkout's transaction, so that anything the
+        # generator locks is released straight away
+        invoice_ids.prepare_generator()
+        try:
+            if settings.LORIKEET_TWO_PHASE_CHECKOUT:
+                order = self.checkout_two_phase(cart)
+            else:
+                order = self.checkout(cart)
         except exceptions.PaymentError as e:
             return Response(
                 {
@@ -294,3 +665,123 @@ class CheckoutView(APIView):
                     )
 
             return Response(response_body, status=200)
+
+    def prepare_order(self, cart):
+        """Create an order for ``cart``, and move the cart's contents onto it.
+
+        This needs to be called inside a transaction. The order isn't
+        saved, and doesn't have a payment yet; the order, line items and
+        adjustments are returned.
+        """
+        # Price the cart from scratch inside the transaction, rather than
+        # trusting anything computed before it began. The items are loaded
+        # before anything else is read from the snapshot, so that every
+        # total comes from get_total() rather than get_total_expression().
+        cart.invalidate_pricing()
+        pricing = cart.get_pricing()
+        items = pricing.items
+        adjustments = pricing.adjustments
+        item_totals = [pricing.get_item_total(item) for item in items]
+        adjustment_totals = [pricing.get_adjustment_total(adj) for adj in adjustments]
+        running_total = sum(item_totals + adjustment_totals, Decimal(0))
+        if running_total != pricing.grand_total:
+            raise InconsistentStateError(
+                "Cart {} has a grand total of {}, but its items and "
+                "adjustments add up to {}".format(
+                    cart.id, pricing.grand_total, running_total
+                )
+            )
+        order = models.Order.objects.create(
+            user=cart.user, grand_total=pricing.grand_total, guest_email=cart.email
+        )
+
+        # Get an invoice ID if required
+        generator = invoice_ids.get_generator()
+        if generator is not None:
+            order.custom_invoice_id = generator()
+
+        # Check the cart is ready to be checked out
+        cart.is_complete(raise_exc=True, for_checkout=True)
+
+        # Copy items and adjustments onto order, storing their totals. All
+        # of the totals come from the pricing snapshot taken above, because
+        # some get_total() methods (especially on adjustments) might depend
+        # on the state of the rest of the cart, and if we call them on a
+        # half-empty cart, they might not return the correct result.
+        move_to_order(models.LineItem, cart, order, items, item_totals)
+        move_to_order(models.Adjustment, cart, order, adjustments, adjustment_totals)
+        for item in items:
+            item.prepare_for_checkout()
+        for adj in adjustments:
+            adj.prepare_for_checkout()
+        cart_emptied(cart)
+
+        # copy delivery address over
+        order.delivery_address = cart.delivery_address
+        return order, items, adjustments
+
+    def make_payment(self, cart, order):
+        payment = resolve(
+            cart.payment_method_subclass.make_payment(order, order.grand_total)
+        )
+        if not isinstance(payment, models.Payment):
+            raise TypeError(
+                "{}.make_payment() returned {!r}, not a Payment "
+                "subclass".format(cart.payment_method.__class__.__name__, payment)
+            )
+        return payment
+
+    def checkout(self, cart):
+        """Check out ``cart``, charging its payment method in the transaction."""
+        with atomic():
+            order, _, _ = self.prepare_order(cart)
+            order.payment = self.make_payment(cart, order)
+            order.save()
+        return order
+
+    def checkout_two_phase(self, cart):
+        """Check out ``cart``, charging its payment method between transactions.
+
+        The order is committed with ``payment_pending`` set before the
+        payment method is charged, so that locks taken while checking the
+        cart aren't held while waiting for the payment provider. If the
+        payment fails, the items and adjustments are moved back into the
+        cart and the order is deleted.
+        """
+        with atomic():
+            order, items, adjustments = self.prepare_order(cart)
+            order.payment_pending = True
+            order.save()
+
+        try:
+            payment = self.make_payment(cart, order)
+        except Exception:
+            self.cancel_order(cart, order, items, adjustments)
+            raise
+
+        try:
+            with atomic():
+                order.payment = payment
+                order.payment_pending = False
+                order.save()
+                for item in items:
+                    item.complete_checkout()
+                for adj in adjustments:
+                    adj.complete_checkout()
+        except Exception:
+            logger.exception("Couldn't finalise order %s, cancelling payment", order.id)
+            cart.payment_method_subclass.cancel_payment(payment)
+            self.cancel_order(cart, order, items, adjustments)
+            raise
+        return order
+
+    def cancel_order(self, cart, order, items, adjustments):
+        with atomic():
+            move_to_cart(models.LineItem, order, cart, items)
+            move_to_cart(models.Adjustment, order, cart, adjustments)
+            for item in items:
+                item.cancel_checkout()
+            for adj in adjustments:
+                adj.cancel_checkout()
+            cart_emptied(cart)
+            order.delete()
@@ -1,9 +1,11 @@
 from decimal import ROUND_DOWN, Decimal
-from json import loads
+from json import dumps, loads
 
 import pytest
 from shop import factories, models as smodels
 
+from . import models
+
 
 @pytest.mark.django_db
 def test_empty_cart(client):
@@ -14,6 +16,7 @@ def test_empty_cart(client):
     assert data == {
         "items": [],
         "new_item_url": "/_cart/new/",
+        "new_items_url": "/_cart/new-bulk/",
         "subtotal": "0.00",
         "delivery_addresses": [],
         "new_address_url": "/_cart/new-address/",
@@ -22,6 +25,7 @@ def test_empty_cart(client):
         "adjustments": [],
         "new_adjustment_url": "/_cart/new-adjustment/",
         "grand_total": "0.00",
+        "item_count": 0,
         "incomplete_reasons": [
             {
                 "code": "not_set",
@@ -46,9 +50,12 @@ def test_empty_cart(client):
         ],
         "is_complete": False,
         "checkout_url": "/_cart/checkout/",
+        "batch_url": "/_cart/batch/",
+        "events_url": None,
         "is_authenticated": False,
         "email": None,
-        "compatible_version": 2,
+        "revision": 0,
+        "compatible_version": 3,
         "incompatible_version": 1,
     }
 
@@ -62,6 +69,7 @@ def test_empty_cart_logged_in(admin_client):
     assert data == {
         "items": [],
         "new_item_url": "/_cart/new/",
+        "new_items_url": "/_cart/new-bulk/",
         "subtotal": "0.00",
         "delivery_addresses": [],
         "new_address_url": "/_cart/new-address/",
@@ -70,6 +78,7 @@ def test_empty_cart_logged_in(admin_client):
         "adjustments": [],
         "new_adjustment_url": "/_cart/new-adjustment/",
         "grand_total": "0.00",
+        "item_count": 0,
         "incomplete_reasons": [
             {
                 "code": "not_set",
@@ -89,9 +98,12 @@ def test_empty_cart_logged_in(admin_client):
         ],
         "is_complete": False,
         "checkout_url": "/_cart/checkout/",
+        "batch_url": "/_cart/batch/",
+        "events_url": None,
         "is_authenticated": True,
         "email": None,
-        "compatible_version": 2,
+        "revision": models.Cart.objects.get().revision,
+        "compatible_version": 3,
         "incompatible_version": 1,
     }
 
@@ -280,3 +292,137 @@ def test_cart_payment_methods_logged_in(admin_user, admin_client, admin_cart):
             "url": "/_cart/payment-method/{}/".format(admin_cart.payment_method_id),
         },
     ]
+
+
+@pytest.mark.django_db
+def test_anonymous_cart_not_saved_until_changed(client):
+    resp = client.get("/_cart/")
+    assert resp.status_code == 200
+    assert models.Cart.objects.count() == 0
+    assert "cart_id" not in client.session
+
+    p = factories.ProductFactory()
+    resp = client.post(
+        "/_cart/new/",
+        dumps({"type": "MyLineItem", "data": {"product": p.id, "quantity": 2}}),
+        content_type="application/json",
+    )
+    assert resp.status_code == 201
+    cart = models.Cart.objects.get()
+    assert client.session["cart_id"] == cart.id
+    assert cart.items.count() == 1
+
+    data = loads(client.get("/_cart/").content.decode("utf-8"))
+    assert len(data["items"]) == 1
+
+
+@pytest.mark.django_db
+def test_anonymous_cart_saved_on_email(client):
+    resp = client.patch(
+        "/_cart/",
+        dumps({"email": "someone@example.com"}),
+        content_type="application/json",
+    )
+    assert resp.status_code == 200
+    assert models.Cart.objects.get(id=client.session["cart_id"]).email == (
+        "someone@example.com"
+    )
+
+
+@pytest.mark.django_db
+def test_cart_etag(client, cart, django_assert_num_queries):
+    resp = client.get("/_cart/")
+    etag = resp["ETag"]
+    assert etag == 'W/"{}-{}"'.format(cart.id, cart.revision)
+
+    # Session, and the revision of the cart
+    with django_assert_num_queries(2):
+        resp = client.get("/_cart/", HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+
+@pytest.mark.django_db
+def test_cart_etag_changes(client, cart):
+    etag = client.get("/_cart/")["ETag"]
+    factories.MyLineItemFactory(cart=cart)
+    resp = client.get("/_cart/", HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200
+    assert resp["ETag"] != etag
+    assert len(loads(resp.content.decode("utf-8"))["items"]) == 1
+
+
+@pytest.mark.django_db
+def test_cart_etag_changes_on_selection_change(client, filled_cart):
+    etag = client.get("/_cart/")["ETag"]
+    address = filled_cart.delivery_address
+    address.active = False
+    address.save()
+    assert client.get("/_cart/", HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_cart_etag_changes_on_new_address_logged_in(
+    admin_user, admin_client, admin_cart
+):
+    etag = admin_client.get("/_cart/")["ETag"]
+    factories.AustralianDeliveryAddressFactory(user=admin_user)
+    assert admin_client.get("/_cart/", HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_cart_etag_logged_in(admin_client, admin_cart):
+    etag = admin_client.get("/_cart/")["ETag"]
+    assert etag == 'W/"{}-{}"'.format(admin_cart.id, admin_cart.revision)
+    assert admin_client.get("/_cart/", HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+
+@pytest.mark.django_db
+def test_unsaved_cart_has_no_etag(client):
+    assert not client.get("/_cart/").has_header("ETag")
+
+
+@pytest.mark.django_db
+def test_cart_sparse_fields(client, filled_cart, django_assert_max_num_queries):
+    with django_assert_max_num_queries(10) as queries:
+        resp = client.get("/_cart/?fields=item_count,grand_total")
+    assert resp.status_code == 200
+    for query in queries.captured_queries:
+        assert 'FROM "lorikeet_deliveryaddress"' not in query["sql"]
+        assert 'FROM "lorikeet_paymentmethod"' not in query["sql"]
+    data = loads(resp.content.decode("utf-8"))
+    assert data == {
+        "item_count": 2,
+        "grand_total": str(filled_cart.get_grand_total().quantize(Decimal(".01"))),
+        "compatible_version": 3,
+        "incompatible_version": 1,
+    }
+
+
+@pytest.mark.django_db
+def test_cart_sparse_fields_incomplete_reasons(client, cart):
+    data = loads(
+        client.get("/_cart/?fields=incomplete_reasons").content.decode("utf-8")
+    )
+    assert [x["field"] for x in data["incomplete_reasons"]] == [
+        "delivery_address",
+        "payment_method",
+        "items",
+        "email",
+    ]
+
+
+@pytest.mark.django_db
+def test_cart_sparse_fields_unknown(client, cart):
+    resp = client.get("/_cart/?fields=items,nonsense")
+    assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+def test_anonymous_cart_not_saved_on_invalid_email(client):
+    resp = client.patch(
+        "/_cart/", dumps({"email": "not an email"}), content_type="application/json"
+    )
+    assert resp.status_code == 400
+    assert not models.Cart.objects.exists()
+    assert "cart_id" not in client.session
@@ -0,0 +1,135 @@
+from json import dumps, loads
+
+import pytest
+from shop import factories, models as smodels
+
+from . import models
+
+ADDRESS = {
+    "addressee": "Leigh Brenecki",
+    "address": "Level 1, 290 Wright Street",
+    "suburb": "Adelaide",
+    "state": "SA",
+    "postcode": "5000",
+}
+
+
+@pytest.mark.django_db
+def test_batch(client, cart):
+    p = factories.ProductFactory()
+    resp = client.post(
+        "/_cart/batch/",
+        dumps(
+            [
+                {
+                    "op": "new",
+                    "type": "MyLineItem",
+                    "data": {"product": p.id, "quantity": 2},
+                },
+                {
+                    "op": "new-address",
+                    "type": "AustralianDeliveryAddress",
+                    "data": ADDRESS,
+                },
+                {
+                    "op": "new-payment-method",
+                    "type": "PipeCard",
+                    "data": {"card_token": "Lvfn4242"},
+                },
+                {
+                    "op": "new-adjustment",
+                    "type": "CartDiscount",
+                    "data": {"percentage": 25},
+                },
+                {"op": "update", "data": {"email": "someone@example.com"}},
+            ]
+        ),
+        content_type="application/json",
+    )
+    assert resp.status_code == 200
+    data = loads(resp.content.decode("utf-8"))
+    assert len(data["items"]) == 1
+    assert len(data["adjustments"]) == 1
+    assert data["delivery_addresses"][0]["selected"]
+    assert data["payment_methods"][0]["selected"]
+    assert data["email"] == "someone@example.com"
+    assert data["is_complete"]
+
+    cart.refresh_from_db()
+    assert cart.items.count() == 1
+    assert cart.adjustments.count() == 1
+    assert cart.delivery_address is not None
+    assert cart.payment_method is not None
+
+
+@pytest.mark.django_db
+def test_batch_rolled_back_on_error(client, cart):
+    p = factories.ProductFactory()
+    resp = client.post(
+        "/_cart/batch/",
+        dumps(
+            [
+                {
+                    "op": "new",
+                    "type": "MyLineItem",
+                    "data": {"product": p.id, "quantity": 2},
+                },
+                {"op": "update", "data": {"email": "not an email"}},
+            ]
+        ),
+        content_type="application/json",
+    )
+    assert resp.status_code == 400
+    data = loads(resp.content.decode("utf-8"))
+    assert data["index"] == 1
+    assert "email" in data["errors"]
+    assert not smodels.MyLineItem.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"op": "new"},
+        [{"op": "delete"}],
+        [{"op": "new", "type": "NotALineItem", "data": {}}],
+        ["new"],
+    ],
+)
+def test_batch_invalid(client, cart, body):
+    resp = client.post("/_cart/batch/", dumps(body), content_type="application/json")
+    assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+def test_batch_saves_anonymous_cart(client):
+    resp = client.post(
+        "/_cart/batch/",
+        dumps([{"op": "update", "data": {"email": "someone@example.com"}}]),
+        content_type="application/json",
+    )
+    assert resp.status_code == 200
+    cart = models.Cart.objects.get(id=client.session["cart_id"])
+    assert cart.email == "someone@example.com"
+
+
+@pytest.mark.django_db
+def test_batch_invalid_new_cart(client):
+    p = factories.ProductFactory()
+    resp = client.post(
+        "/_cart/batch/",
+        dumps(
+            [
+                {
+                    "op": "new",
+                    "type": "MyLineItem",
+                    "data": {"product": p.id, "quantity": 2},
+                },
+                {"op": "update", "data": {"email": "not an email"}},
+            ]
+        ),
+        content_type="application/json",
+    )
+    assert resp.status_code == 400
+    assert not models.Cart.objects.exists()
+    assert "cart_id" not in client.session
@@ -0,0 +1,115 @@
+from json import dumps, loads
+
+import pytest
+from shop import factories
+
+from . import models, settings as lorikeet_settings
+
+
+@pytest.mark.django_db
+def test_bulk_add(client, cart):
+    p1 = factories.ProductFactory()
+    p2 = factories.ProductFactory()
+    resp = client.post(
+        "/_cart/new-bulk/",
+        dumps(
+            [
+                {"type": "MyLineItem", "data": {"product": p1.id, "quantity": 2}},
+                {"type": "MyLineItem", "data": {"product": p2.id, "quantity": 3}},
+            ]
+        ),
+        content_type="application/json",
+    )
+    assert resp.status_code == 201
+    data = loads(resp.content.decode("utf-8"))
+    assert len(data["items"]) == 2
+    assert data["revision"] == cart.revision + 1
+
+    cart.refresh_from_db()
+    assert sorted(cart.items.values_list("mylineitem__quantity", flat=True)) == [2, 3]
+
+
+@pytest.mark.django_db
+def test_bulk_add_new_cart(client):
+    p = factories.ProductFactory()
+    resp = client.post(
+        "/_cart/new-bulk/",
+        dumps([{"type": "MyLineItem", "data": {"product": p.id, "quantity": 1}}]),
+        content_type="application/json",
+    )
+    assert resp.status_code == 201
+    cart = models.Cart.objects.get(id=client.session["cart_id"])
+    assert cart.items.count() == 1
+
+
+@pytest.mark.django_db
+def test_bulk_add_invalid_item_new_cart(client):
+    resp = client.post(
+        "/_cart/new-bulk/",
+        dumps([{"type": "MyLineItem", "data": {"quantity": 1}}]),
+        content_type="application/json",
+    )
+    assert resp.status_code == 400
+    assert not models.Cart.objects.exists()
+    assert "cart_id" not in client.session
+
+
+@pytest.mark.django_db
+def test_bulk_add_stores_totals_once(client, cart, monkeypatch):
+    monkeypatch.setattr(lorikeet_settings, "LORIKEET_STORE_CART_TOTALS", True)
+    calls = []
+    update_totals = models.Cart.update_totals
+    monkeypatch.setattr(
+        models.Cart,
+        "update_totals",
+        lambda self, *a, **kw: calls.append(self) or update_totals(self, *a, **kw),
+    )
+    products = factories.ProductFactory.create_batch(3)
+    resp = client.post(
+        "/_cart/new-bulk/",
+        dumps(
+            [
+                {"type": "MyLineItem", "data": {"product": p.id, "quantity": 1}}
+                for p in products
+            ]
+        ),
+        content_type="application/json",
+    )
+    assert resp.status_code == 201
+    assert len(calls) == 1
+
+    cart.refresh_from_db()
+    assert cart.item_count == 3
+    assert cart.grand_total == sum(p.unit_price for p in products)
+
+
+@pytest.mark.django_db
+def test_bulk_add_invalid_item(client, cart):
+    p = factories.ProductFactory()
+    resp = client.post(
+        "/_cart/new-bulk/",
+        dumps(
+            [
+                {"type": "MyLineItem", "data": {"product": p.id, "quantity": 1}},
+                {"type": "MyLineItem", "data": {"quantity": 1}},
+                {"type": "NotALineItem", "data": {}},
+            ]
+        ),
+        content_type="application/json",
+    )
+    assert resp.status_code == 400
+    errors = loads(resp.content.decode("utf-8"))["errors"]
+    assert errors[0] == {}
+    assert "product" in errors[1]
+    assert "type" in errors[2]
+    assert cart.items.count() == 0
+
+
+@pytest.mark.django_db
+def test_bulk_add_not_a_list(client, cart):
+    resp = client.post(
+        "/_cart/new-bulk/",
+        dumps({"type": "MyLineItem", "data": {}}),
+        content_type="application/json",
+    )
+    assert resp.status_code == 400
@@ -3,6 +3,8 @@ from json import dumps, loads
 import pytest
 from shop import factories, models as smodels
 
+from . import models
+
 
 @pytest.mark.django_db
 def test_add_item_to_cart(client):
@@ -16,6 +18,18 @@ def test_add_item_to_cart(client):
     assert smodels.MyLineItem.objects.count() == 1
 
 
+@pytest.mark.django_db
+def test_add_invalid_item_to_new_cart(client):
+    resp = client.post(
+        "/_cart/new/",
+        dumps({"type": "MyLineItem", "data": {"quantity": 2}}),
+        content_type="application/json",
+    )
+    assert resp.status_code == 400
+    assert not models.Cart.objects.exists()
+    assert "cart_id" not in client.session
+
+
 @pytest.mark.django_db
 def test_view_cart_item(client, cart):
     i = factories.MyLineItemFactory(cart=cart)
@@ -36,6 +50,18 @@ def test_view_cart_item(client, cart):
     }
 
 
+@pytest.mark.django_db
+def test_view_cart_item_async_total(client, cart, monkeypatch):
+    async def get_total(self):
+        return self.quantity * self.product.unit_price
+
+    monkeypatch.setattr(smodels.MyLineItem, "get_total", get_total)
+    i = factories.MyLineItemFactory(cart=cart)
+    resp = client.get("/_cart/{}/".format(i.id))
+    data = loads(resp.content.decode("utf-8"))
+    assert data["total"] == str(i.quantity * i.product.unit_price)
+
+
 @pytest.mark.django_db
 def test_cannot_view_cart_item_not_in_cart(client):
     i = factories.MyLineItemFactory()
@@ -72,3 +98,19 @@ def test_change_cart_item(client, cart):
     print(resp.content)
     assert resp.status_code == 200
     assert smodels.MyLineItem.objects.get(id=i.id).quantity == new_qty
+
+
+@pytest.mark.django_db
+def test_add_existing_item_to_cart(client, cart):
+    item = factories.MyLineItemFactory(cart=cart, quantity=2)
+    resp = client.post(
+        "/_cart/new/",
+        dumps(
+            {"type": "MyLineItem", "data": {"product": item.product.id, "quantity": 3}}
+        ),
+        content_type="application/json",
+    )
+    assert resp.status_code == 201
+    assert cart.items.count() == 1
+    item.refresh_from_db()
+    assert item.quantity == 5
@@ -1,9 +1,13 @@
+from decimal import Decimal
 from json import dumps, loads
 
 import pytest
-from shop import models as smodels
+from django.db import connection
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.test.utils import CaptureQueriesContext
+from shop import factories, models as smodels
 
-from . import models
+from . import api_views, models, pricing
 
 
 @pytest.mark.django_db
@@ -30,6 +34,35 @@ def test_checkout(client, filled_cart):
         assert adj.total_when_charged
 
 
+@pytest.mark.django_db
+def test_checkout_moves_items_in_bulk(client, filled_cart):
+    factories.MyLineItemFactory.create_batch(5, cart=filled_cart)
+    expected_totals = {x.id: x.total for x in filled_cart.items.select_subclasses()}
+    with CaptureQueriesContext(connection) as queries:
+        resp = client.post(
+            "/_cart/checkout/", dumps({}), content_type="application/json"
+        )
+    assert resp.status_code == 200
+    item_updates = [
+        q for q in queries if q["sql"].startswith('UPDATE "lorikeet_lineitem"')
+    ]
+    assert len(item_updates) == 1
+
+    order = models.Order.objects.get()
+    assert {x.id: x.total_when_charged for x in order.items.all()} == expected_totals
+
+
+@pytest.mark.django_db
+def test_move_to_order_inconsistent(filled_cart):
+    items = list(filled_cart.items.select_subclasses())
+    order = models.Order.objects.create(grand_total=0)
+    models.LineItem.objects.filter(id=items[0].id).update(cart=None)
+    with pytest.raises(api_views.InconsistentStateError):
+        api_views.move_to_order(
+            models.LineItem, filled_cart, order, items, [x.total for x in items]
+        )
+
+
 @pytest.mark.django_db
 def test_cart_incomplete(client, cart):
     resp = client.post("/_cart/checkout/", dumps({}), content_type="application/json")
@@ -77,3 +110,38 @@ def test_payment_failed(client, filled_cart):
     filled_cart.refresh_from_db()
     assert filled_cart.items.count() == 2
     assert models.Order.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_checkout_charges_item_totals(client, filled_cart, monkeypatch):
+    # An expression that disagrees with get_total() must not change what's charged
+    monkeypatch.setattr(
+        smodels.MyLineItem,
+        "get_total_expression",
+        classmethod(
+            lambda cls: ExpressionWrapper(
+                F("quantity") * F("product__unit_price") * 2,
+                output_field=DecimalField(max_digits=7, decimal_places=2),
+            )
+        ),
+    )
+    resp = client.post("/_cart/checkout/", dumps({}), content_type="application/json")
+    assert resp.status_code == 200
+
+    order = models.Order.objects.get()
+    charged = sum(x.total_when_charged for x in order.items.all())
+    charged += sum(x.total_when_charged for x in order.adjustments.all())
+    assert order.grand_total == charged
+
+
+@pytest.mark.django_db
+def test_checkout_inconsistent_totals(client, filled_cart, monkeypatch):
+    monkeypatch.setattr(
+        pricing.CartPricing,
+        "grand_total",
+        property(lambda self: Decimal("0.01")),
+    )
+    with pytest.raises(api_views.InconsistentStateError):
+        client.post("/_cart/checkout/", dumps({}), content_type="application/json")
+    assert models.Order.objects.count() == 0
+    assert filled_cart.items.count() == 2
@@ -0,0 +1,111 @@
+from datetime import timedelta
+from json import dumps, loads
+
+import pytest
+from django.utils.timezone import now
+from shop import models as smodels
+
+from . import models
+from .api_views import CheckoutView
+
+
+def checkout(client, key):
+    return client.post(
+        "/_cart/checkout/",
+        dumps({}),
+        content_type="application/json",
+        HTTP_IDEMPOTENCY_KEY=key,
+    )
+
+
+@pytest.mark.django_db
+def test_replayed(client, filled_cart):
+    resp = checkout(client, "abc123")
+    assert resp.status_code == 200
+    assert "Idempotent-Replayed" not in resp
+
+    replayed = checkout(client, "abc123")
+    assert replayed.status_code == 200
+    assert replayed["Idempotent-Replayed"] == "true"
+    assert loads(replayed.content.decode("utf-8")) == loads(
+        resp.content.decode("utf-8")
+    )
+    assert models.Order.objects.count() == 1
+    assert smodels.PipePayment.objects.count() == 1
+
+    attempt = models.CheckoutAttempt.objects.get()
+    assert attempt.order == models.Order.objects.get()
+
+
+@pytest.mark.django_db
+def test_new_key_checks_out_again(client, filled_cart):
+    assert checkout(client, "abc123").status_code == 200
+    resp = checkout(client, "def456")
+    assert resp.status_code == 422
+    assert loads(resp.content.decode("utf-8"))["reason"] == "incomplete"
+
+
+@pytest.mark.django_db
+def test_failure_replayed(client, filled_cart):
+    filled_cart.payment_method = smodels.PipeCard.objects.create(card_id="Visa4949")
+    filled_cart.save()
+    resp = checkout(client, "abc123")
+    assert resp.status_code == 422
+
+    filled_cart.payment_method = smodels.PipeCard.objects.create(card_id="Visa4242")
+    filled_cart.save()
+    replayed = checkout(client, "abc123")
+    assert replayed.status_code == 422
+    assert loads(replayed.content.decode("utf-8")) == loads(
+        resp.content.decode("utf-8")
+    )
+    assert models.Order.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_in_progress(client, filled_cart):
+    models.CheckoutAttempt.objects.create(cart=filled_cart, idempotency_key="abc123")
+    resp = checkout(client, "abc123")
+    assert resp.status_code == 409
+    assert models.Order.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_abandoned_taken_over(client, filled_cart):
+    models.CheckoutAttempt.objects.create(
+        cart=filled_cart,
+        idempotency_key="abc123",
+        created_on=now() - timedelta(seconds=CheckoutView.abandoned_after + 1),
+    )
+    resp = checkout(client, "abc123")
+    assert resp.status_code == 200
+    assert models.Order.objects.count() == 1
+
+    attempt = models.CheckoutAttempt.objects.get()
+    assert attempt.status_code == 200
+    assert attempt.order == models.Order.objects.get()
+
+
+@pytest.mark.django_db
+def test_key_scoped_to_cart(client, filled_cart, admin_cart):
+    models.CheckoutAttempt.objects.create(
+        cart=admin_cart, idempotency_key="abc123", status_code=200, response_body="{}"
+    )
+    assert checkout(client, "abc123").status_code == 200
+    assert models.Order.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_exception_not_stored(client, filled_cart, monkeypatch):
+    def fail(self, order, amount):
+        raise RuntimeError()
+
+    monkeypatch.setattr(smodels.PipeCard, "make_payment", fail)
+    with pytest.raises(RuntimeError):
+        checkout(client, "abc123")
+    assert not models.CheckoutAttempt.objects.exists()
+
+
+@pytest.mark.django_db
+def test_key_too_long(client, filled_cart):
+    assert checkout(client, "a" * 256).status_code == 400
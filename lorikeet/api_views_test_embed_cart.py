@@ -0,0 +1,60 @@
+from json import dumps, loads
+
+import pytest
+from shop import factories
+
+from . import models
+
+
+@pytest.mark.django_db
+def test_add_item_embeds_cart(client, cart):
+    p = factories.ProductFactory()
+    resp = client.post(
+        "/_cart/new/",
+        dumps({"type": "MyLineItem", "data": {"product": p.id, "quantity": 2}}),
+        content_type="application/json",
+        HTTP_X_LORIKEET_EMBED="cart",
+    )
+    assert resp.status_code == 201
+    data = loads(resp.content.decode("utf-8"))
+    assert data["result"]["quantity"] == 2
+    assert len(data["cart"]["items"]) == 1
+    assert data["cart"]["subtotal"] == str(p.unit_price * 2)
+
+
+@pytest.mark.django_db
+def test_delete_item_embeds_cart(client, cart):
+    item = factories.MyLineItemFactory(cart=cart)
+    resp = client.delete("/_cart/{}/?embed=cart".format(item.id))
+    assert resp.status_code == 200
+    data = loads(resp.content.decode("utf-8"))
+    assert data["result"] is None
+    assert data["cart"]["items"] == []
+    assert data["cart"]["item_count"] == 0
+
+
+@pytest.mark.django_db
+def test_deselect_address_embeds_cart(client, filled_cart):
+    resp = client.delete(
+        "/_cart/address/{}/".format(filled_cart.delivery_address_id),
+        HTTP_X_LORIKEET_EMBED="cart",
+    )
+    assert resp.status_code == 200
+    data = loads(resp.content.decode("utf-8"))
+    assert data["cart"]["delivery_addresses"] == []
+    assert not data["cart"]["is_complete"]
+
+
+@pytest.mark.django_db
+def test_cart_not_embedded_by_default(client, cart):
+    item = factories.MyLineItemFactory(cart=cart)
+    resp = client.delete("/_cart/{}/".format(item.id))
+    assert resp.status_code == 204
+    assert not models.LineItem.objects.filter(id=item.id).exists()
+
+
+@pytest.mark.django_db
+def test_cart_not_embedded_in_errors(client, cart):
+    resp = client.get("/_cart/1234/", HTTP_X_LORIKEET_EMBED="cart")
+    assert resp.status_code == 404
+    assert "cart" not in loads(resp.content.decode("utf-8"))
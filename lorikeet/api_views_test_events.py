@@ -0,0 +1,60 @@
+from json import loads
+
+import pytest
+
+from . import events, settings as lorikeet_settings
+from .api_views import CartEventsView
+from .events import LocalEventBus
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    bus = LocalEventBus()
+    monkeypatch.setattr(events, "_bus", bus)
+    monkeypatch.setattr(CartEventsView, "keepalive_interval", 0)
+    monkeypatch.setattr(lorikeet_settings, "LORIKEET_CART_EVENTS", True)
+    return bus
+
+
+@pytest.mark.django_db
+def test_cart_events(bus, client, cart):
+    resp = client.get("/_cart/events/")
+    assert resp.status_code == 200
+    assert resp["Content-Type"] == "text/event-stream"
+    stream = iter(resp.streaming_content)
+
+    assert next(stream) == b'data: {"revision": 0}\n\n'
+    assert bus.has_subscribers()
+
+    bus.publish(cart.id, 3)
+    assert next(stream) == b'data: {"revision": 3}\n\n'
+    assert next(stream) == b": keepalive\n\n"
+
+    resp.close()
+    assert not bus.has_subscribers()
+
+
+@pytest.mark.django_db
+def test_cart_events_end(bus, monkeypatch, client, cart):
+    monkeypatch.setattr(CartEventsView, "max_duration", 0)
+    resp = client.get("/_cart/events/")
+    assert len(list(resp.streaming_content)) == 2
+    assert not bus.has_subscribers()
+
+
+@pytest.mark.django_db
+def test_cart_events_unsaved_cart(bus, client):
+    assert client.get("/_cart/events/").status_code == 204
+
+
+@pytest.mark.django_db
+def test_cart_events_url(bus, client, cart):
+    data = loads(client.get("/_cart/").content.decode("utf-8"))
+    assert data["events_url"] == "/_cart/events/"
+
+
+@pytest.mark.django_db
+def test_cart_events_disabled(client, cart):
+    assert client.get("/_cart/events/").status_code == 404
+    data = loads(client.get("/_cart/").content.decode("utf-8"))
+    assert data["events_url"] is None
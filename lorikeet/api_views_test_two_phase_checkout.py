@@ -0,0 +1,84 @@
+from json import dumps, loads
+
+import pytest
+from django.db import connection
+from shop import models as smodels
+
+from . import models, settings as lorikeet_settings
+
+
+@pytest.fixture(autouse=True)
+def two_phase(monkeypatch):
+    monkeypatch.setattr(lorikeet_settings, "LORIKEET_TWO_PHASE_CHECKOUT", True)
+
+
+def record_calls(monkeypatch, model, name):
+    calls = []
+    monkeypatch.setattr(model, name, lambda self, *args: calls.append(self))
+    return calls
+
+
+@pytest.mark.django_db
+def test_checkout(client, filled_cart, monkeypatch):
+    completed = record_calls(monkeypatch, smodels.MyLineItem, "complete_checkout")
+    cancelled = record_calls(monkeypatch, smodels.MyLineItem, "cancel_checkout")
+    expected_total = filled_cart.get_grand_total()
+
+    resp = client.post("/_cart/checkout/", dumps({}), content_type="application/json")
+    assert resp.status_code == 200
+    order = models.Order.objects.get(id=loads(resp.content.decode("utf-8"))["id"])
+    assert not order.payment_pending
+    assert order.grand_total == expected_total
+    assert smodels.PipePayment.objects.get(id=order.payment_id).amount == expected_total
+    assert order.items.count() == 2
+    assert len(completed) == 2
+    assert not cancelled
+    assert filled_cart.items.count() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_payment_made_outside_transaction(client, filled_cart, monkeypatch):
+    in_transaction = []
+    make_payment = smodels.PipeCard.make_payment
+
+    def record(self, order, amount):
+        in_transaction.append(connection.in_atomic_block)
+        assert models.Order.objects.get(id=order.id).payment_pending
+        return make_payment(self, order, amount)
+
+    monkeypatch.setattr(smodels.PipeCard, "make_payment", record)
+    resp = client.post("/_cart/checkout/", dumps({}), content_type="application/json")
+    assert resp.status_code == 200
+    assert in_transaction == [False]
+
+
+@pytest.mark.django_db
+def test_payment_failed(client, filled_cart, monkeypatch):
+    cancelled = record_calls(monkeypatch, smodels.MyLineItem, "cancel_checkout")
+    filled_cart.payment_method = smodels.PipeCard.objects.create(card_id="Visa4949")
+    filled_cart.save()
+
+    resp = client.post("/_cart/checkout/", dumps({}), content_type="application/json")
+    assert resp.status_code == 422
+    assert loads(resp.content.decode("utf-8"))["reason"] == "payment"
+    assert models.Order.objects.count() == 0
+    assert len(cancelled) == 2
+    items = filled_cart.items.all()
+    assert len(items) == 2
+    assert all(x.order_id is None and x.total_when_charged is None for x in items)
+    assert filled_cart.adjustments.count() == 1
+
+
+@pytest.mark.django_db
+def test_finalise_failed(client, filled_cart, monkeypatch):
+    refunded = record_calls(monkeypatch, smodels.PipeCard, "cancel_payment")
+
+    def fail(self):
+        raise RuntimeError()
+
+    monkeypatch.setattr(smodels.MyLineItem, "complete_checkout", fail)
+    with pytest.raises(RuntimeError):
+        client.post("/_cart/checkout/", dumps({}), content_type="application/json")
+    assert len(refunded) == 1
+    assert models.Order.objects.count() == 0
+    assert filled_cart.items.count() == 2
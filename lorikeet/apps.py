@@ -6,4 +6,7 @@ class LorikeetAppConfig(AppConfig):
     verbose_name = "Lorikeet"
 
     def ready(self):
-        from . import signal_handlers  # noqa
+        from . import cart_checkers, invoice_ids, signal_handlers  # noqa
+
+        cart_checkers.load_checkers()
+        invoice_ids.load_generator()
@@ -0,0 +1,33 @@
+from asyncio import gather
+from inspect import isawaitable
+
+from asgiref.sync import async_to_sync
+
+
+async def _gather(values):
+    return await gather(*values)
+
+
+def resolve(value):
+    """Wait for ``value`` if it's awaitable, and return its result.
+
+    This lets hooks like :meth:`~lorikeet.models.LineItem.get_total` and
+    :meth:`~lorikeet.models.PaymentMethod.make_payment` be implemented
+    with ``async def`` while still being called from synchronous code.
+    """
+    return resolve_all([value])[0]
+
+
+def resolve_all(values):
+    """Like :func:`resolve`, but for a list of values.
+
+    Any awaitables in ``values`` are awaited concurrently, so a list of
+    totals that each come from a remote service only waits for the
+    slowest of them.
+    """
+    values = list(values)
+    awaitables = [x for x in values if isawaitable(x)]
+    if not awaitables:
+        return values
+    results = iter(async_to_sync(_gather)(awaitables))
+    return [next(results) if isawaitable(x) else x for x in values]
@@ -0,0 +1,63 @@
+from decimal import Decimal
+from json import dumps
+from unittest import mock
+
+import pytest
+from asgiref.sync import sync_to_async
+from shop import models as smodels
+
+from . import models
+from .async_support import resolve, resolve_all
+from .pricing import CartPricing
+
+
+async def later(value):
+    return value
+
+
+def test_resolve():
+    assert resolve(1) == 1
+    assert resolve(later(2)) == 2
+
+
+def test_resolve_all():
+    assert resolve_all([1, later(2), 3, later(4)]) == [1, 2, 3, 4]
+
+
+@pytest.mark.django_db
+def test_async_get_total(filled_cart):
+    expected = CartPricing(filled_cart).item_totals
+
+    async def get_total(self):
+        return self.quantity * self.product.unit_price
+
+    with mock.patch.object(smodels.MyLineItem, "get_total", get_total):
+        pricing = CartPricing(filled_cart)
+        assert pricing.item_totals == expected
+        assert pricing.items[0].total == expected[pricing.items[0].id]
+
+
+@pytest.mark.django_db
+def test_async_adjustment_total(filled_cart):
+    async def get_total(self, subtotal):
+        return Decimal("-1.00")
+
+    with mock.patch.object(smodels.CartDiscount, "get_total", get_total):
+        pricing = CartPricing(filled_cart)
+        assert pricing.grand_total == pricing.subtotal - 1
+
+
+@pytest.mark.django_db
+def test_async_make_payment(client, filled_cart):
+    async def make_payment(self, order, amount):
+        create = sync_to_async(smodels.PipePayment.objects.create)
+        return await create(method=self, amount=amount)
+
+    with mock.patch.object(smodels.PipeCard, "make_payment", make_payment):
+        resp = client.post(
+            "/_cart/checkout/", dumps({}), content_type="application/json"
+        )
+
+    assert resp.status_code == 200
+    order = models.Order.objects.get()
+    assert order.payment.pipepayment.amount == order.grand_total
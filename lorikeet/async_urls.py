@@ -0,0 +1,35 @@
+import django
+from django.conf.urls import url
+from django.core.exceptions import ImproperlyConfigured
+
+from . import api_views, async_views
+
+if django.VERSION < (3, 1):
+    raise ImproperlyConfigured("Lorikeet's async views require Django 3.1 or later.")
+
+app_name = "lorikeet"
+
+urlpatterns = [
+    url(r"^$", async_views.cart, name="cart"),
+    url(r"^(?P<id>\d+)/$", async_views.cart_item, name="cart-item"),
+    url(r"^new/$", async_views.add_to_cart, name="add-to-cart"),
+    url(r"^new-bulk/$", async_views.add_to_cart_bulk, name="add-to-cart-bulk"),
+    url(r"^address/(?P<id>\d+)/$", async_views.address, name="address"),
+    url(r"^new-address/$", async_views.new_address, name="new-address"),
+    url(
+        r"^payment-method/(?P<id>\d+)/$",
+        async_views.payment_method,
+        name="payment-method",
+    ),
+    url(
+        r"^new-payment-method/$",
+        async_views.new_payment_method,
+        name="new-payment-method",
+    ),
+    url(r"^adjustment/(?P<id>\d+)/$", async_views.adjustment, name="adjustment"),
+    url(r"^new-adjustment/$", async_views.new_adjustment, name="new-adjustment"),
+    # Streams are iterated synchronously, so this one stays synchronous
+    url(r"^events/$", api_views.CartEventsView.as_view(), name="events"),
+    url(r"^batch/$", async_views.batch, name="batch"),
+    url(r"^checkout/$", async_views.checkout, name="checkout"),
+]
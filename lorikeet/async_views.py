@@ -0,0 +1,53 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from . import api_views
+
+
+def _run_view(view, request, *args, **kwargs):
+    # Worker threads outlive requests, so tidy up their connections the
+    # same way Django does at the start and end of a request
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, "render", None)):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Wrap a synchronous view in an async view that runs it in a thread pool.
+
+    Django runs synchronous views under ASGI in the thread it reserves for
+    synchronous code; running them in a pool instead means that a slow
+    request, such as a checkout waiting on a payment provider, doesn't
+    hold up any others. This only moves the work to another thread: the
+    view still occupies that thread until it returns, including while an
+    ``async def`` hook like ``make_payment()`` is awaited.
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(_run_view, thread_sensitive=False)(
+            view, request, *args, **kwargs
+        )
+
+    return wrapper
+
+
+cart = async_view(api_views.CartView.as_view())
+cart_item = async_view(api_views.CartItemView.as_view())
+add_to_cart = async_view(api_views.AddToCartView.as_view())
+add_to_cart_bulk = async_view(api_views.BulkAddToCartView.as_view())
+address = async_view(api_views.DeliveryAddressView.as_view())
+new_address = async_view(api_views.NewAddressView.as_view())
+payment_method = async_view(api_views.PaymentMethodView.as_view())
+new_payment_method = async_view(api_views.NewPaymentMethodView.as_view())
+adjustment = async_view(api_views.AdjustmentView.as_view())
+new_adjustment = async_view(api_views.NewAdjustmentView.as_view())
+batch = async_view(api_views.BatchView.as_view())
+checkout = async_view(api_views.CheckoutView.as_view())
@@ -0,0 +1,87 @@
+from json import dumps, loads
+from threading import current_thread
+
+import django
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf.urls import include, url
+from django.http import HttpResponse
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from shop import models as smodels
+
+from . import async_views, models
+from .middleware import cart_getter_factory
+
+requires_async_views = pytest.mark.skipif(
+    django.VERSION < (3, 1), reason="Async views require Django 3.1 or later"
+)
+
+if django.VERSION >= (3, 1):
+    urlpatterns = [
+        url(r"^_cart/", include("lorikeet.async_urls", namespace="lorikeet"))
+    ]
+
+
+def test_async_view_runs_in_thread_pool(rf):
+    threads = []
+
+    def view(request):
+        threads.append(current_thread())
+        return HttpResponse("ok")
+
+    resp = async_to_sync(async_views.async_view(view))(rf.get("/"))
+    assert resp.content == b"ok"
+    assert threads[0] is not current_thread()
+
+
+def test_async_view_renders_response(rf):
+    class View(APIView):
+        def get(self, request):
+            return Response({"ok": True})
+
+    resp = async_to_sync(async_views.async_view(View.as_view()))(rf.get("/"))
+    assert loads(resp.content.decode("utf-8")) == {"ok": True}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_checkout_view(rf, admin_user, filled_admin_cart, monkeypatch):
+    threads = []
+    make_payment = sync_to_async(smodels.PipeCard.make_payment, thread_sensitive=True)
+
+    async def async_make_payment(self, order, amount):
+        threads.append(current_thread())
+        return await make_payment(self, order, amount)
+
+    monkeypatch.setattr(smodels.PipeCard, "make_payment", async_make_payment)
+    request = rf.post("/_cart/checkout/", dumps({}), content_type="application/json")
+    request.user = admin_user
+    request.session = {}
+    request.get_cart = cart_getter_factory(request)
+    request._dont_enforce_csrf_checks = True  # noqa
+
+    resp = async_to_sync(async_views.checkout)(request)
+    assert resp.status_code == 200
+    assert models.Order.objects.count() == 1
+    # The payment hook is awaited on an event loop in a worker thread
+    assert threads[0] is not current_thread()
+
+
+@requires_async_views
+@pytest.mark.urls(__name__)
+@pytest.mark.django_db(transaction=True)
+def test_async_cart(client, filled_cart):
+    resp = client.get("/_cart/")
+    assert resp.status_code == 200
+    data = loads(resp.content.decode("utf-8"))
+    assert len(data["items"]) == 2
+    assert data["new_item_url"] == "/_cart/new/"
+
+
+@requires_async_views
+@pytest.mark.urls(__name__)
+@pytest.mark.django_db(transaction=True)
+def test_async_checkout(client, filled_cart):
+    resp = client.post("/_cart/checkout/", dumps({}), content_type="application/json")
+    assert resp.status_code == 200
+    assert models.Order.objects.count() == 1
@@ -1,10 +1,90 @@
-from .exceptions import IncompleteCartError
+from logging import getLogger
+from time import perf_counter
+
+from django.utils.module_loading import import_string
+
+from . import settings, signals
+from .exceptions import IncompleteCartError, IncompleteCartErrorSet
+
+logger = getLogger(__name__)
+
+_checkers = None
+
+
+def load_checkers():
+    """Import every checker in :data:`LORIKEET_CART_COMPLETE_CHECKERS`.
+
+    This is called once when Lorikeet's app config is ready, so that
+    checking a cart never has to import anything.
+    """
+    global _checkers  # pylint: disable = global-statement
+    _checkers = [
+        (path, import_string(path)) for path in settings.LORIKEET_CART_COMPLETE_CHECKERS
+    ]
+
+
+def get_checkers():
+    """Get the checkers loaded by :func:`load_checkers`.
+
+    :return: A list of ``(import_path, checker)`` tuples.
+    """
+    if _checkers is None:
+        load_checkers()
+    return _checkers
+
+
+def check_cart(cart, for_checkout=False):
+    """Run every cart checker, line item check and adjustment check on a cart.
+
+    Checkers are passed the cart itself; the line items and adjustments in
+    it are loaded into its :meth:`~lorikeet.models.Cart.get_pricing`
+    snapshot before any of them run, so checkers should read them from
+    there (and read ``delivery_address_id`` and ``payment_method_id``, or
+    ``delivery_address_subclass`` and ``payment_method_subclass``, rather
+    than ``delivery_address`` and ``payment_method``) to avoid extra
+    queries.
+
+    The time taken by each checker is logged, and sent along with the
+    :data:`~lorikeet.signals.cart_checked` signal.
+
+    :return: All of the reasons the cart can't be checked out.
+    :rtype: lorikeet.exceptions.IncompleteCartErrorSet
+    """
+    errors = IncompleteCartErrorSet()
+    timings = {}
+    pricing = cart.get_pricing()
+    checks = [
+        (path, lambda checker=checker: checker(cart))
+        for path, checker in get_checkers()
+    ]
+    checks += [
+        (
+            "{}.check_complete".format(type(x).__name__),
+            lambda x=x: x.check_complete(for_checkout),
+        )
+        for x in pricing.items + pricing.adjustments
+    ]
+
+    for name, check in checks:
+        start = perf_counter()
+        try:
+            check()
+        except IncompleteCartError as e:
+            errors.add(e)
+        finally:
+            timings[name] = timings.get(name, 0) + perf_counter() - start
+
+    logger.debug("Checked cart %s in %r", cart.id, timings)
+    signals.cart_checked.send(
+        sender=type(cart), cart=cart, for_checkout=for_checkout, timings=timings
+    )
+    return errors
 
 
 def delivery_address_required(cart):
     """Prevents checkout unless a delivery address is selected."""
 
-    if cart.delivery_address is None:
+    if cart.delivery_address_id is None:
         raise IncompleteCartError(
             "not_set", "A delivery address is required.", "delivery_address"
         )
@@ -13,7 +93,7 @@ def delivery_address_required(cart):
 def payment_method_required(cart):
     """Prevents checkout unless a payment method is selected."""
 
-    if cart.payment_method is None:
+    if cart.payment_method_id is None:
         raise IncompleteCartError(
             "not_set", "A payment method is required.", "payment_method"
         )
@@ -22,12 +102,12 @@ def payment_method_required(cart):
 def cart_not_empty(cart):
     """Prevents checkout of an empty cart."""
 
-    if not cart.items.exists():
+    if not cart.get_pricing().items:
         raise IncompleteCartError("empty", "There are no items in the cart.", "items")
 
 
 def email_address_if_anonymous(cart):
     """Prevents anonymous users checking out without an email address."""
 
-    if not cart.user and not cart.email:
+    if not cart.user_id and not cart.email:
         raise IncompleteCartError("not_set", "An email address is required.", "email")
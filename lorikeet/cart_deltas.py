@@ -0,0 +1,74 @@
+from django.core.cache import cache
+
+from . import settings as lorikeet_settings
+
+CART_PAYLOAD_CACHE_KEY_TPL = "au.com.cmv.open-source.lorikeet.cart-payload.{}.{}"
+
+#: Keys of the cart payload that hold lists of entries, each of which is
+#: identified by its ``url``
+LIST_FIELDS = ("items", "adjustments", "delivery_addresses", "payment_methods")
+
+#: Keys that are included in every delta, even if they haven't changed
+ALWAYS_INCLUDED = ("revision", "compatible_version", "incompatible_version")
+
+
+def remember_payload(cart_id, data):
+    """Store a serialized cart, so later deltas can be calculated against it.
+
+    Does nothing unless :data:`LORIKEET_CART_DELTA_CACHE_TIMEOUT` is set.
+    """
+    timeout = lorikeet_settings.LORIKEET_CART_DELTA_CACHE_TIMEOUT
+    if timeout is None or cart_id is None:
+        return
+    cache.set(
+        CART_PAYLOAD_CACHE_KEY_TPL.format(cart_id, data["revision"]), data, timeout
+    )
+
+
+def get_delta(cart_id, data, since):
+    """Get the changes to a serialized cart since revision ``since``.
+
+    Returns ``None`` if the payload for that revision isn't available,
+    in which case the client needs the whole of ``data`` instead.
+    """
+    if lorikeet_settings.LORIKEET_CART_DELTA_CACHE_TIMEOUT is None:
+        return None
+    old = cache.get(CART_PAYLOAD_CACHE_KEY_TPL.format(cart_id, since))
+    if old is None:
+        return None
+    return diff_payloads(old, data)
+
+
+def diff_list(old, new):
+    old_by_url = {x["url"]: x for x in old}
+    new_urls = {x["url"] for x in new}
+    diff = {
+        "added": [x for x in new if x["url"] not in old_by_url],
+        "changed": [
+            x for x in new if x["url"] in old_by_url and x != old_by_url[x["url"]]
+        ],
+        "removed": [x["url"] for x in old if x["url"] not in new_urls],
+    }
+    if any(diff.values()):
+        return diff
+    return None
+
+
+def diff_payloads(old, new):
+    """Describe how to turn one serialized cart into another.
+
+    Each key in :data:`LIST_FIELDS` that changed maps to the ``added`` and
+    ``changed`` entries, and the URLs of the ``removed`` ones. The other
+    keys that changed are under ``changed``.
+    """
+    delta = {"delta": True, "since": old["revision"], "changed": {}}
+    for key, value in new.items():
+        if key in ALWAYS_INCLUDED:
+            delta[key] = value
+        elif key in LIST_FIELDS:
+            diff = diff_list(old.get(key, []), value)
+            if diff is not None:
+                delta[key] = diff
+        elif key not in old or old[key] != value:
+            delta["changed"][key] = value
+    return delta
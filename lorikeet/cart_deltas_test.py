@@ -0,0 +1,89 @@
+from json import loads
+
+import pytest
+from django.core.cache import cache
+from shop import factories
+
+from . import settings as lorikeet_settings
+from .cart_deltas import diff_payloads
+
+
+@pytest.fixture
+def deltas(monkeypatch):
+    monkeypatch.setattr(lorikeet_settings, "LORIKEET_CART_DELTA_CACHE_TIMEOUT", 60)
+    yield
+    cache.clear()
+
+
+def payload(revision, items, **kwargs):
+    data = {
+        "items": items,
+        "adjustments": [],
+        "grand_total": "0.00",
+        "revision": revision,
+        "compatible_version": 3,
+        "incompatible_version": 1,
+    }
+    data.update(kwargs)
+    return data
+
+
+def test_diff_payloads():
+    kept = {"url": "/_cart/1/", "total": "1.00"}
+    removed = {"url": "/_cart/2/", "total": "2.00"}
+    changed = {"url": "/_cart/3/", "total": "3.00"}
+    added = {"url": "/_cart/4/", "total": "4.00"}
+    old = payload(1, [kept, removed, changed], grand_total="6.00")
+    new = payload(2, [kept, dict(changed, total="4.00"), added], grand_total="9.00")
+
+    assert diff_payloads(old, new) == {
+        "delta": True,
+        "since": 1,
+        "revision": 2,
+        "compatible_version": 3,
+        "incompatible_version": 1,
+        "changed": {"grand_total": "9.00"},
+        "items": {
+            "added": [added],
+            "changed": [dict(changed, total="4.00")],
+            "removed": ["/_cart/2/"],
+        },
+    }
+
+
+@pytest.mark.django_db
+def test_cart_delta(deltas, client, cart):
+    first = loads(client.get("/_cart/").content.decode("utf-8"))
+    factories.MyLineItemFactory(cart=cart)
+
+    resp = client.get("/_cart/?since={}".format(first["revision"]))
+    assert resp.status_code == 200
+    data = loads(resp.content.decode("utf-8"))
+    assert data["delta"]
+    assert data["since"] == first["revision"]
+    assert data["revision"] > first["revision"]
+    assert len(data["items"]["added"]) == 1
+    assert "adjustments" not in data
+    assert "subtotal" in data["changed"]
+    assert "new_item_url" not in data["changed"]
+
+
+@pytest.mark.django_db
+def test_cart_delta_unknown_revision(deltas, client, cart):
+    data = loads(client.get("/_cart/?since=1234").content.decode("utf-8"))
+    assert "delta" not in data
+    assert data["items"] == []
+
+
+@pytest.mark.django_db
+def test_cart_delta_disabled(client, cart):
+    first = loads(client.get("/_cart/").content.decode("utf-8"))
+    data = loads(
+        client.get("/_cart/?since={}".format(first["revision"])).content.decode("utf-8")
+    )
+    assert "delta" not in data
+
+
+@pytest.mark.django_db
+def test_cart_delta_invalid_revision(client, cart):
+    assert client.get("/_cart/?since=latest").status_code == 400
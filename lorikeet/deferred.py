@@ -0,0 +1,77 @@
+from concurrent import futures
+from functools import wraps
+from logging import getLogger
+
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+from . import settings
+
+logger = getLogger(__name__)
+
+_executor = None
+
+
+class ThreadPoolExecutor:
+    """Runs deferred handlers on a pool of threads in the current process.
+
+    This is the default value of :data:`LORIKEET_DEFERRED_EXECUTOR`.
+    Handlers that haven't finished when the process exits are lost, so if
+    they need to run reliably, use a task queue instead (see
+    :class:`lorikeet.extras.celery.tasks.CeleryExecutor`).
+    """
+
+    max_workers = 4
+
+    def __init__(self):
+        self.pool = futures.ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="lorikeet-deferred"
+        )
+
+    def submit(self, handler, sender, **kwargs):
+        return self.pool.submit(self.run, handler, sender, kwargs)
+
+    def run(self, handler, sender, kwargs):
+        try:
+            handler(sender=sender, **kwargs)
+        except Exception:  # pylint: disable = broad-except
+            logger.exception("Exception in deferred handler %s", handler)
+        finally:
+            # Connections are per-thread, so close the ones this one opened
+            connections.close_all()
+
+
+def get_executor():
+    """Get the executor named by :data:`LORIKEET_DEFERRED_EXECUTOR`."""
+    global _executor  # pylint: disable = global-statement
+    if _executor is None:
+        _executor = import_string(settings.LORIKEET_DEFERRED_EXECUTOR)()
+    return _executor
+
+
+def deferrable(handler):
+    """Mark a receiver of :data:`~lorikeet.signals.order_checked_out` as deferrable.
+
+    If :data:`LORIKEET_DEFER_HANDLERS` is enabled, the handler is passed to
+    the executor once the checkout transaction has been committed, instead
+    of being run before the response is sent. Its return value can't be
+    merged into the response, so only mark handlers whose return value
+    the client can do without::
+
+        @receiver(order_checked_out)
+        @deferrable
+        def notify_warehouse(sender, order, request, **kwargs):
+            ...
+
+    Otherwise, the handler runs as it normally would.
+    """
+
+    @wraps(handler)
+    def wrapper(sender, **kwargs):
+        if not settings.LORIKEET_DEFER_HANDLERS:
+            return handler(sender=sender, **kwargs)
+        executor = get_executor()
+        transaction.on_commit(lambda: executor.submit(handler, sender, **kwargs))
+        return None
+
+    return wrapper
@@ -0,0 +1,83 @@
+from json import dumps, loads
+from threading import current_thread
+
+import pytest
+
+from . import deferred, settings as lorikeet_settings, signals
+
+
+class InlineExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, handler, sender, **kwargs):
+        self.submitted.append(handler)
+        handler(sender=sender, **kwargs)
+
+
+@pytest.fixture
+def handler_calls():
+    calls = []
+
+    @deferred.deferrable
+    def handler(sender, order, request, **kwargs):
+        calls.append(order)
+        return {"deferred_handler": True}
+
+    signals.order_checked_out.connect(handler)
+    yield calls
+    signals.order_checked_out.disconnect(handler)
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = InlineExecutor()
+    monkeypatch.setattr(lorikeet_settings, "LORIKEET_DEFER_HANDLERS", True)
+    monkeypatch.setattr(deferred, "_executor", executor)
+    return executor
+
+
+def checkout(client):
+    resp = client.post("/_cart/checkout/", dumps({}), content_type="application/json")
+    assert resp.status_code == 200
+    return loads(resp.content.decode("utf-8"))
+
+
+@pytest.mark.django_db
+def test_not_deferred_by_default(client, filled_cart, handler_calls):
+    data = checkout(client)
+    assert data["deferred_handler"]
+    assert len(handler_calls) == 1
+
+
+@pytest.mark.django_db
+def test_deferred(client, filled_cart, handler_calls, executor, monkeypatch):
+    callbacks = []
+    monkeypatch.setattr(deferred.transaction, "on_commit", callbacks.append)
+    data = checkout(client)
+    assert "deferred_handler" not in data
+    assert not handler_calls
+
+    for callback in callbacks:
+        callback()
+    assert len(handler_calls) == 1
+    assert handler_calls[0].id == data["id"]
+    assert len(executor.submitted) == 1
+
+
+def test_thread_pool_executor():
+    threads = []
+    executor = deferred.ThreadPoolExecutor()
+    future = executor.submit(
+        lambda sender, **kwargs: threads.append(current_thread().name), None
+    )
+    future.result()
+    assert threads[0].startswith("lorikeet-deferred")
+
+
+def test_thread_pool_executor_logs_exceptions(caplog):
+    def handler(sender, **kwargs):
+        raise RuntimeError("oops")
+
+    deferred.ThreadPoolExecutor().submit(handler, None).result()
+    assert "Exception in deferred handler" in caplog.text
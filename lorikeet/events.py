@@ -0,0 +1,92 @@
+from collections import defaultdict
+from queue import Empty, Queue
+from threading import Lock
+
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from . import settings
+
+_bus = None
+
+
+class Subscription:
+    """A stream of changes to a single cart.
+
+    Iterating over a subscription yields the revision of the cart each time
+    it changes (or ``None``, if the new revision isn't known), and yields
+    ``Subscription.TIMEOUT`` if ``timeout`` seconds pass without a change.
+    Call :meth:`close` once you're done with it.
+    """
+
+    TIMEOUT = object()
+
+    def __init__(self, bus, cart_id, timeout=None):
+        self.bus = bus
+        self.cart_id = cart_id
+        self.timeout = timeout
+        self.queue = Queue()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return self.queue.get(timeout=self.timeout)
+        except Empty:
+            return self.TIMEOUT
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class LocalEventBus:
+    """Delivers cart changes to subscribers in the same process.
+
+    This is the default value of :data:`LORIKEET_CART_EVENT_BUS`. It works
+    with the development server, and with deployments that serve every
+    request from one process; if changes to a cart can be made in a
+    different process to the one streaming them, you'll need a bus backed
+    by something those processes share, like Redis.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.subscriptions = defaultdict(set)
+
+    def subscribe(self, cart_id, timeout=None):
+        subscription = Subscription(self, cart_id, timeout)
+        with self.lock:
+            self.subscriptions[cart_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.cart_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.cart_id, None)
+
+    def has_subscribers(self):
+        return bool(self.subscriptions)
+
+    def publish(self, cart_id, revision=None):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(cart_id, ()))
+        for subscription in subscriptions:
+            subscription.queue.put(revision)
+
+
+def get_bus():
+    """Get the event bus named by :data:`LORIKEET_CART_EVENT_BUS`."""
+    global _bus  # pylint: disable = global-statement
+    if _bus is None:
+        _bus = import_string(settings.LORIKEET_CART_EVENT_BUS)()
+    return _bus
+
+
+def cart_changed(cart_id, revision=None):
+    """Tell subscribers that a cart has changed, once the change is committed."""
+    bus = get_bus()
+    if bus.has_subscribers():
+        transaction.on_commit(lambda: bus.publish(cart_id, revision))
@@ -0,0 +1,59 @@
+import pytest
+from shop import factories, models as smodels
+
+from . import events, models
+from .events import LocalEventBus, Subscription
+
+
+def test_local_event_bus():
+    bus = LocalEventBus()
+    subscription = bus.subscribe(1, timeout=0)
+    other = bus.subscribe(2, timeout=0)
+    assert bus.has_subscribers()
+
+    bus.publish(1, 5)
+    assert next(subscription) == 5
+    assert next(subscription) is Subscription.TIMEOUT
+    assert next(other) is Subscription.TIMEOUT
+
+    subscription.close()
+    other.close()
+    assert not bus.has_subscribers()
+
+
+@pytest.fixture
+def subscribe(monkeypatch):
+    bus = LocalEventBus()
+    monkeypatch.setattr(events, "_bus", bus)
+    return lambda cart: bus.subscribe(cart.id, timeout=0)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_changes_published_on_commit(subscribe):
+    cart = models.Cart.objects.create(revision=7)
+    subscription = subscribe(cart)
+
+    item = factories.MyLineItemFactory(cart=cart)
+    assert next(subscription) == 8
+
+    cart.email = "someone@example.com"
+    cart.save()
+    assert next(subscription) == 9
+
+    # The item doesn't have the cart cached, so its revision isn't known
+    smodels.MyLineItem.objects.get(id=item.id).save()
+    assert next(subscription) is None
+    assert models.Cart.objects.get(id=cart.id).revision == 10
+
+    models.Cart.objects.filter(id=cart.id).bump_revision()
+    assert next(subscription) is None
+    assert next(subscription) is Subscription.TIMEOUT
+    subscription.close()
+
+
+@pytest.mark.django_db
+def test_changes_not_published_before_commit(subscribe, cart):
+    subscription = subscribe(cart)
+    cart.bump_revision()
+    assert next(subscription) is Subscription.TIMEOUT
+    subscription.close()
@@ -0,0 +1 @@
+default_app_config = "lorikeet.extras.celery.apps.CeleryAppConfig"
@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class CeleryAppConfig(AppConfig):
+    name = "lorikeet.extras.celery"
+    # Don't clash with anything else that calls itself celery
+    label = "lorikeet_celery"
@@ -0,0 +1,46 @@
+from urllib.parse import urlsplit
+
+from celery import shared_task
+from django.test import RequestFactory
+from django.utils.module_loading import import_string
+from lorikeet.models import Order
+from lorikeet.signals import order_checked_out
+
+
+class CeleryExecutor:
+    """Runs deferred handlers as Celery tasks.
+
+    Only the order's ID and the base URL of the request are sent to the
+    worker, so handlers get a freshly loaded order, and a stand-in request
+    that's only good for ``build_absolute_uri()``. Any other keyword
+    arguments the signal was sent with are passed through as they are, so
+    they need to be serializable by the task's serializer.
+    """
+
+    def submit(self, handler, sender, order, request, signal=None, **kwargs):
+        # The worker passes order_checked_out itself, since a signal can't
+        # be serialized
+        run_deferred_handler.delay(
+            "{}.{}".format(handler.__module__, handler.__qualname__),
+            order.id,
+            request.build_absolute_uri("/"),
+            kwargs,
+        )
+
+
+@shared_task
+def run_deferred_handler(handler_path, order_id, base_url, kwargs=None):
+    handler = import_string(handler_path)
+    # Run the handler itself, rather than deferring it again
+    handler = getattr(handler, "__wrapped__", handler)
+    url = urlsplit(base_url)
+    request = RequestFactory().get(
+        "/", secure=url.scheme == "https", HTTP_HOST=url.netloc
+    )
+    handler(
+        sender=Order,
+        signal=order_checked_out,
+        order=Order.objects.get(id=order_id),
+        request=request,
+        **(kwargs or {})
+    )
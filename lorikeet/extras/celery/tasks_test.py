@@ -0,0 +1,56 @@
+import pytest
+from lorikeet import models
+from lorikeet.deferred import deferrable
+from lorikeet.signals import order_checked_out
+
+celery = pytest.importorskip("celery")
+
+from kombu.exceptions import EncodeError  # noqa: E402 isort:skip
+
+from . import tasks  # noqa: E402 isort:skip
+
+calls = []
+
+
+@deferrable
+def handler(sender, order, request, **kwargs):
+    calls.append((sender, order, request, kwargs))
+
+
+@pytest.fixture
+def eager():
+    conf = celery.current_app.conf
+    conf.task_always_eager = conf.task_eager_propagates = True
+    yield
+    conf.task_always_eager = conf.task_eager_propagates = False
+    calls.clear()
+
+
+@pytest.mark.django_db
+def test_celery_executor(eager, rf):
+    order = models.Order.objects.create(grand_total=0)
+    request = rf.get("/checkout/", secure=True)
+    tasks.CeleryExecutor().submit(
+        handler,
+        models.Order,
+        order=order,
+        request=request,
+        signal=order_checked_out,
+        note="gift",
+    )
+
+    [(sender, got_order, got_request, kwargs)] = calls
+    assert sender is models.Order
+    assert got_order == order
+    assert got_request.build_absolute_uri("/orders/") == "https://testserver/orders/"
+    assert kwargs == {"signal": order_checked_out, "note": "gift"}
+
+
+@pytest.mark.django_db
+def test_celery_executor_unserializable_kwargs(eager, rf):
+    order = models.Order.objects.create(grand_total=0)
+    # Rejected when it's sent, rather than when the worker gets it
+    with pytest.raises(EncodeError):
+        tasks.CeleryExecutor().submit(
+            handler, models.Order, order=order, request=rf.get("/"), note=object()
+        )
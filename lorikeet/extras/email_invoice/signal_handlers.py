@@ -3,6 +3,7 @@ from logging import getLogger
 from django.core.mail import send_mail
 from django.dispatch import receiver
 from django.template.loader import render_to_string
+from lorikeet.deferred import deferrable
 from lorikeet.signals import order_checked_out
 from premailer import transform
 
@@ -13,6 +14,7 @@ logger = getLogger(__name__)
 
 
 @receiver(order_checked_out)
+@deferrable
 def send_email_invoice(sender, order, request, **kwargs):
     subject = settings.subject.format(order=order)
     recipient = order.user.email if order.user else order.guest_email
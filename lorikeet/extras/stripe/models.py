@@ -91,6 +91,9 @@ class StripeCard(PaymentMethod):
         else:
             return StripePayment.objects.create(method=self, charge_id=chg["id"])
 
+    def cancel_payment(self, payment):
+        stripe.Refund.create(charge=payment.charge_id)
+
 
 class StripePayment(Payment):
     charge_id = models.CharField(max_length=30)
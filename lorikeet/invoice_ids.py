@@ -0,0 +1,147 @@
+from collections import deque
+from threading import Lock, local
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from . import models, settings
+
+_generator = None
+
+
+def load_generator():
+    """Import the function named by :data:`LORIKEET_INVOICE_ID_GENERATOR`.
+
+    This is called once when Lorikeet's app config is ready, so that
+    checking out never has to import anything.
+    """
+    global _generator  # pylint: disable = global-statement
+    path = settings.LORIKEET_INVOICE_ID_GENERATOR
+    _generator = import_string(path) if path is not None else None
+
+
+def get_generator():
+    """Get the invoice ID generator loaded by :func:`load_generator`.
+
+    Returns ``None`` if custom invoice IDs aren't used.
+    """
+    if _generator is None:
+        load_generator()
+    return _generator
+
+
+def prepare_generator():
+    """Let the invoice ID generator get ready to issue an ID.
+
+    Checkout calls this before its transaction begins, so that generators
+    can do work there that would otherwise hold locks until the payment
+    provider responds. Generators opt in by defining a ``prepare()``
+    method, which takes no arguments.
+    """
+    prepare = getattr(get_generator(), "prepare", None)
+    if prepare is not None:
+        prepare()
+
+
+class BlockInvoiceIDGenerator:
+    """Hands out sequential invoice IDs, reserving them in blocks.
+
+    Each process reserves :attr:`block_size` IDs at a time from an
+    :class:`~lorikeet.models.InvoiceIDCounter` row, so the row is only
+    updated (and locked) once per block rather than once per order. At
+    checkout, an ID is set aside for the request before its transaction
+    begins, so a new block is reserved and committed straight away, and
+    the row isn't locked while the payment is made. Only one block is
+    reserved at a time per process.
+
+    IDs are unique, and increase roughly in the order they're issued, but
+    there will be gaps: IDs left in a block when a process exits are
+    never issued, and neither are IDs used by a checkout that fails.
+
+    An instance of this class is available at
+    ``lorikeet.invoice_ids.block_invoice_id``; to change its behaviour,
+    subclass it, override the attributes below, and point
+    :data:`LORIKEET_INVOICE_ID_GENERATOR` at an instance of your subclass.
+    """
+
+    #: The name of the counter row to reserve IDs from. Generators with
+    #: different names issue IDs independently of each other.
+    counter_name = "invoice_id"
+
+    #: How many IDs to reserve at a time.
+    block_size = 100
+
+    #: The first ID to issue, when the counter row doesn't exist yet.
+    first_id = 1
+
+    #: A format string that each ID is passed through.
+    template = "{}"
+
+    def __init__(self):
+        # Held while taking an ID, including while reserving a block, so
+        # only one reservation is ever in flight
+        self.lock = Lock()
+        # Non-empty ranges of reserved IDs, in the order they'll be issued
+        self.blocks = deque()
+        # The ID set aside for each thread by prepare()
+        self.prepared = local()
+
+    def __call__(self):
+        value = getattr(self.prepared, "value", None)
+        self.prepared.value = None
+        if value is None:
+            value = self.take()
+        return self.template.format(value)
+
+    def prepare(self):
+        """Set aside an ID for this thread's next call.
+
+        If this reserves a new block outside of a transaction, it's
+        committed straight away.
+        """
+        if getattr(self.prepared, "value", None) is None:
+            self.prepared.value = self.take()
+
+    def take(self):
+        with self.lock:
+            if not self.blocks:
+                start = self.reserve_block()
+                rest = range(start + 1, start + self.block_size)
+                if transaction.get_connection().in_atomic_block:
+                    # The rest of the block can only be handed out once the
+                    # reservation has been committed; if it's rolled back,
+                    # another process could reserve the same block.
+                    transaction.on_commit(lambda: self.add_block(rest))
+                elif rest:
+                    self.blocks.append(rest)
+                return start
+            block = self.blocks.popleft()
+            if len(block) > 1:
+                self.blocks.appendleft(block[1:])
+            return block[0]
+
+    def add_block(self, block):
+        if block:
+            with self.lock:
+                self.blocks.append(block)
+
+    def reserve_block(self):
+        """Reserve the next block of IDs, and return the first one."""
+        counters = models.InvoiceIDCounter.objects.filter(name=self.counter_name)
+        with transaction.atomic():
+            if not counters.update(next_value=F("next_value") + self.block_size):
+                try:
+                    with transaction.atomic():
+                        models.InvoiceIDCounter.objects.create(
+                            name=self.counter_name,
+                            next_value=self.first_id + self.block_size,
+                        )
+                    return self.first_id
+                except IntegrityError:
+                    # Another process created the counter first
+                    counters.update(next_value=F("next_value") + self.block_size)
+            return counters.values_list("next_value", flat=True).get() - self.block_size
+
+
+block_invoice_id = BlockInvoiceIDGenerator()
@@ -0,0 +1,133 @@
+from json import dumps
+from threading import Barrier, Thread
+from unittest import mock
+
+import pytest
+from django.db import connection, transaction
+
+from . import invoice_ids, models, settings as lorikeet_settings
+
+
+class SmallBlocks(invoice_ids.BlockInvoiceIDGenerator):
+    block_size = 3
+
+
+@pytest.fixture
+def generator_path(monkeypatch):
+    monkeypatch.setattr(
+        lorikeet_settings,
+        "LORIKEET_INVOICE_ID_GENERATOR",
+        "lorikeet.invoice_ids.block_invoice_id",
+    )
+    invoice_ids.load_generator()
+    yield
+    monkeypatch.undo()
+    invoice_ids.load_generator()
+
+
+@pytest.mark.django_db
+def test_checkout(client, filled_cart, generator_path):
+    with mock.patch.object(invoice_ids, "import_string") as import_mock:
+        resp = client.post(
+            "/_cart/checkout/", dumps({}), content_type="application/json"
+        )
+    assert resp.status_code == 200
+    import_mock.assert_not_called()
+    assert models.Order.objects.get().custom_invoice_id == "1"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_ids_issued_in_blocks():
+    generator = SmallBlocks()
+    assert [generator() for _ in range(5)] == ["1", "2", "3", "4", "5"]
+    assert models.InvoiceIDCounter.objects.get(name="invoice_id").next_value == 7
+
+
+@pytest.mark.django_db(transaction=True)
+def test_processes_get_separate_blocks():
+    first = SmallBlocks()
+    second = SmallBlocks()
+    ids = [first(), second(), first(), second(), second(), second()]
+    assert ids == ["1", "4", "2", "5", "6", "7"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rolled_back_block_not_used():
+    first = SmallBlocks()
+    second = SmallBlocks()
+    assert [first() for _ in range(3)] == ["1", "2", "3"]
+    with pytest.raises(ValueError):
+        with transaction.atomic():
+            assert first() == "4"
+            raise ValueError()
+    assert second() == "4"
+    # The rolled back block was never handed to the first generator
+    assert first() == "7"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_checkout_reserves_outside_transaction(client, filled_cart, generator_path):
+    in_transaction = []
+    reserve_block = invoice_ids.BlockInvoiceIDGenerator.reserve_block
+
+    def record(self):
+        in_transaction.append(connection.in_atomic_block)
+        return reserve_block(self)
+
+    with mock.patch.object(
+        invoice_ids.BlockInvoiceIDGenerator, "reserve_block", record
+    ):
+        resp = client.post(
+            "/_cart/checkout/", dumps({}), content_type="application/json"
+        )
+    assert resp.status_code == 200
+    assert in_transaction == [False]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_blocks_reserved_in_one_transaction_all_used():
+    generator = SmallBlocks()
+    with transaction.atomic():
+        assert generator() == "1"
+        assert generator() == "4"
+    assert [generator() for _ in range(4)] == ["2", "3", "5", "6"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_one_reservation_at_a_time():
+    generator = SmallBlocks()
+    calls = []
+    reserve_block = SmallBlocks.reserve_block
+
+    def record(self):
+        calls.append(self)
+        return reserve_block(self)
+
+    ids = []
+    barrier = Barrier(3)
+
+    def issue():
+        barrier.wait()
+        try:
+            ids.append(generator())
+        finally:
+            connection.close()
+
+    with mock.patch.object(SmallBlocks, "reserve_block", record):
+        threads = [Thread(target=issue) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert sorted(ids) == ["1", "2", "3"]
+    assert len(calls) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_template():
+    class Prefixed(SmallBlocks):
+        counter_name = "prefixed"
+        first_id = 1000
+        template = "INV-{:06}"
+
+    assert Prefixed()() == "INV-001000"
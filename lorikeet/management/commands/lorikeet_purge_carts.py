@@ -0,0 +1,143 @@
+from datetime import timedelta
+from time import perf_counter, sleep
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from ... import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete anonymous carts that haven't changed in a while, along with "
+        "their line items, adjustments, and any guest delivery addresses and "
+        "payment methods that nothing else refers to, and stored checkout "
+        "outcomes that are as old. Carts that existed before upgrading to a "
+        "version of Lorikeet that records when carts change are treated as "
+        "having changed at the time of the upgrade, so they won't be deleted "
+        "until --days after it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=30,
+            help="Delete carts that haven't changed in this many days (default 30).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of carts to delete in each transaction (default 500).",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Seconds to wait between batches, to go easy on a live database.",
+        )
+
+    def handle(self, days, batch_size, pause, **options):
+        cutoff = now() - timedelta(days=days)
+        totals = {
+            "carts": 0,
+            "items": 0,
+            "adjustments": 0,
+            "addresses": 0,
+            "payment_methods": 0,
+        }
+        started = perf_counter()
+
+        while True:
+            batch_started = perf_counter()
+            counts = self.purge_batch(cutoff, batch_size)
+            if not counts["carts"]:
+                break
+            for key, value in counts.items():
+                totals[key] += value
+            self.stdout.write(
+                "Deleted {carts} carts, {items} line items, {adjustments} "
+                "adjustments, {addresses} addresses and {payment_methods} "
+                "payment methods in {elapsed:.2f}s".format(
+                    elapsed=perf_counter() - batch_started, **counts
+                )
+            )
+            if pause:
+                sleep(pause)
+
+        # Retries of a checkout come within minutes, so these are long done
+        attempts, _ = models.CheckoutAttempt.objects.filter(
+            created_on__lt=cutoff
+        ).delete()
+        if attempts:
+            self.stdout.write("Deleted {} checkout attempts".format(attempts))
+
+        elapsed = perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Deleted {carts} carts, {items} line items, {adjustments} "
+                "adjustments, {addresses} addresses and {payment_methods} "
+                "payment methods in {elapsed:.2f}s ({rate:.1f} carts/s)".format(
+                    elapsed=elapsed,
+                    rate=totals["carts"] / elapsed if elapsed else 0,
+                    **totals
+                )
+            )
+        )
+
+    def purge_batch(self, cutoff, batch_size):
+        """Delete up to ``batch_size`` stale carts in a single transaction.
+
+        Returns a dict of how many of each kind of object were deleted.
+        """
+        with transaction.atomic():
+            carts = models.Cart.objects.filter(
+                user__isnull=True, updated_on__lt=cutoff
+            ).order_by("id")
+            if connection.features.has_select_for_update_skip_locked:
+                # Skip over any cart that's being changed right now
+                carts = carts.select_for_update(skip_locked=True)
+            rows = list(
+                carts.values_list("id", "delivery_address_id", "payment_method_id")[
+                    :batch_size
+                ]
+            )
+            if not rows:
+                return {"carts": 0}
+            cart_ids, address_ids, payment_method_ids = zip(*rows)
+
+            # Line items protect their cart, so they need to go first; the
+            # base queryset takes the subclass rows with it
+            _, items = models.LineItem.objects.filter(cart_id__in=cart_ids).delete()
+            _, adjustments = models.Adjustment.objects.filter(
+                cart_id__in=cart_ids
+            ).delete()
+            models.Cart.objects.filter(id__in=cart_ids).delete()
+
+            _, addresses = (
+                models.DeliveryAddress.objects.filter(
+                    id__in=[x for x in address_ids if x is not None], user__isnull=True
+                )
+                .exclude(cart__isnull=False)
+                .exclude(order__isnull=False)
+                .delete()
+            )
+            _, payment_methods = (
+                models.PaymentMethod.objects.filter(
+                    id__in=[x for x in payment_method_ids if x is not None],
+                    user__isnull=True,
+                )
+                .exclude(cart__isnull=False)
+                .exclude(payment__isnull=False)
+                .delete()
+            )
+
+        return {
+            "carts": len(cart_ids),
+            "items": items.get(models.LineItem._meta.label, 0),
+            "adjustments": adjustments.get(models.Adjustment._meta.label, 0),
+            "addresses": addresses.get(models.DeliveryAddress._meta.label, 0),
+            "payment_methods": payment_methods.get(models.PaymentMethod._meta.label, 0),
+        }
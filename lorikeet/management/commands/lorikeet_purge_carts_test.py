@@ -0,0 +1,108 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.utils.timezone import now
+from shop import factories, models as smodels
+
+from ... import models
+from ...conftest import fill_cart
+
+
+def make_stale(*carts):
+    models.Cart.objects.filter(id__in=[x.id for x in carts]).update(
+        updated_on=now() - timedelta(days=31)
+    )
+
+
+def purge(**kwargs):
+    call_command("lorikeet_purge_carts", stdout=StringIO(), **kwargs)
+
+
+@pytest.mark.django_db
+def test_stale_cart_purged(cart):
+    fill_cart(cart)
+    address = cart.delivery_address
+    payment_method = cart.payment_method
+    make_stale(cart)
+
+    purge()
+
+    assert not models.Cart.objects.filter(id=cart.id).exists()
+    assert not models.LineItem.objects.exists()
+    assert not smodels.MyLineItem.objects.exists()
+    assert not models.Adjustment.objects.exists()
+    assert not models.DeliveryAddress.objects.filter(id=address.id).exists()
+    assert not models.PaymentMethod.objects.filter(id=payment_method.id).exists()
+
+
+@pytest.mark.django_db
+def test_recent_cart_kept(cart):
+    fill_cart(cart)
+    purge()
+    assert models.Cart.objects.filter(id=cart.id).exists()
+    assert models.LineItem.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_changing_cart_keeps_it(cart):
+    make_stale(cart)
+    factories.MyLineItemFactory(cart=cart)
+    purge()
+    assert models.Cart.objects.filter(id=cart.id).exists()
+
+
+@pytest.mark.django_db
+def test_user_cart_kept(admin_cart):
+    make_stale(admin_cart)
+    purge()
+    assert models.Cart.objects.filter(id=admin_cart.id).exists()
+
+
+@pytest.mark.django_db
+def test_referenced_address_kept(cart, other_cart):
+    fill_cart(cart)
+    other_cart.delivery_address = cart.delivery_address
+    other_cart.save()
+    make_stale(cart)
+
+    purge()
+
+    assert not models.Cart.objects.filter(id=cart.id).exists()
+    assert models.DeliveryAddress.objects.filter(
+        id=other_cart.delivery_address_id
+    ).exists()
+    assert not models.PaymentMethod.objects.filter(id=cart.payment_method_id).exists()
+
+
+@pytest.mark.django_db
+def test_purged_in_batches(other_cart):
+    carts = [models.Cart.objects.create() for _ in range(4)]
+    make_stale(*carts)
+    out = StringIO()
+
+    call_command("lorikeet_purge_carts", batch_size=3, stdout=out)
+
+    assert not models.Cart.objects.filter(id__in=[x.id for x in carts]).exists()
+    assert models.Cart.objects.filter(id=other_cart.id).exists()
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith("Deleted 3 carts")
+    assert lines[1].startswith("Deleted 1 carts")
+    assert lines[2].startswith("Deleted 4 carts")
+
+
+@pytest.mark.django_db
+def test_old_checkout_attempts_purged(other_cart):
+    old = models.CheckoutAttempt.objects.create(
+        cart=other_cart,
+        idempotency_key="old",
+        created_on=now() - timedelta(days=31),
+    )
+    recent = models.CheckoutAttempt.objects.create(
+        cart=other_cart, idempotency_key="recent"
+    )
+    purge()
+
+    assert not models.CheckoutAttempt.objects.filter(id=old.id).exists()
+    assert models.CheckoutAttempt.objects.filter(id=recent.id).exists()
@@ -2,49 +2,73 @@ from django.core.exceptions import SuspiciousOperation
 from django.middleware.csrf import get_token
 
 from .models import Cart
+from .query_hints import select_related_subclasses
 from .settings import LORIKEET_SET_CSRFTOKEN_EVERYWHERE
 
 
 def cart_getter_factory(request):
-    def get_cart():
-        if hasattr(request, "_cart"):
-            return request._cart  # pylint: disable = protected-access
-
+    def load_cart():
         cart = None
 
+        # Load the selected address and payment method, already downcast,
+        # in the same query as the cart itself
+        carts = select_related_subclasses(
+            Cart.objects.all(), "delivery_address", "payment_method"
+        )
+
         if request.user.is_authenticated:
-            cart, _ = Cart.objects.get_or_create(user=request.user)
+            cart, _ = carts.get_or_create(user=request.user)
         elif "cart_id" in request.session:
             try:
-                cart = Cart.objects.get(id=request.session["cart_id"])
+                cart = carts.get(id=request.session["cart_id"])
             except Cart.DoesNotExist:
                 pass
 
         if cart is None:
             # user is definitely not logged in, might be a new user with no cart,
-            # or might be a user with a stale cart that got deleted
-            cart = Cart.objects.create()
-            request.session["cart_id"] = cart.id
-
-        # save the cart on the request over the top of this function,
-        # so we don't have to look it up again
-        request._cart = cart  # pylint: disable = protected-access
+            # or might be a user with a stale cart that got deleted. Either
+            # way, hand out an empty cart that isn't saved until something
+            # is added to it, so that we don't write a cart and a session
+            # for every visitor (and every crawler).
+            return Cart()
 
         # perform some sanity checks on the cart
-        if not bool(cart.user) == request.user.is_authenticated:
+        if (cart.user_id is not None) != request.user.is_authenticated:
             raise SuspiciousOperation("Session ended up with a cart it shouldn't have")
 
         cart_dirty = False
-        if cart.payment_method is not None and not cart.payment_method.active:
+        payment_method = cart.payment_method_subclass
+        if payment_method is not None and not payment_method.active:
             cart.payment_method = None
             cart_dirty = True
-        if cart.delivery_address is not None and not cart.delivery_address.active:
+        delivery_address = cart.delivery_address_subclass
+        if delivery_address is not None and not delivery_address.active:
             cart.delivery_address = None
             cart_dirty = True
         if cart_dirty:
             cart.save()
         return cart
 
+    def get_cart(persist=False):
+        """Get the cart for the current request.
+
+        :param persist: Set this to ``True`` if you're about to change the
+            cart. Anonymous visitors who haven't changed their cart yet
+            get an unsaved, empty cart; this saves it, and stores it in
+            their session.
+        :type persist: bool
+        """
+        if not hasattr(request, "_cart"):
+            # save the cart on the request, so we don't have to look it
+            # up again
+            request._cart = load_cart()  # pylint: disable = protected-access
+        cart = request._cart  # pylint: disable = protected-access
+
+        if persist and cart.pk is None:
+            cart.save()
+            request.session["cart_id"] = cart.id
+        return cart
+
     return get_cart
 
 
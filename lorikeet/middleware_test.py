@@ -0,0 +1,36 @@
+import pytest
+from shop import models as smodels
+
+from .middleware import cart_getter_factory
+
+
+@pytest.mark.django_db
+def test_cart_loaded_in_one_query(
+    django_assert_num_queries, rf, admin_user, filled_admin_cart
+):
+    request = rf.get("/")
+    request.user = admin_user
+    request.session = {}
+
+    with django_assert_num_queries(1):
+        cart = cart_getter_factory(request)()
+        assert isinstance(
+            cart.delivery_address_subclass, smodels.AustralianDeliveryAddress
+        )
+        assert isinstance(cart.payment_method_subclass, smodels.PipeCard)
+        assert cart.payment_method_subclass.card_id == "Visa4242"
+    assert cart == filled_admin_cart
+
+
+@pytest.mark.django_db
+def test_inactive_selections_removed(rf, admin_user, filled_admin_cart):
+    filled_admin_cart.delivery_address.active = False
+    filled_admin_cart.delivery_address.save()
+    request = rf.get("/")
+    request.user = admin_user
+    request.session = {}
+
+    cart = cart_getter_factory(request)()
+    assert cart.delivery_address_id is None
+    assert cart.delivery_address_subclass is None
+    assert cart.payment_method_id is not None
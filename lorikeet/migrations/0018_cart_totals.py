@@ -0,0 +1,32 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lorikeet", "0017_auto_20200407_1502"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cart",
+            name="grand_total",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, editable=False, max_digits=7, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="cart",
+            name="item_count",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="cart",
+            name="subtotal",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, editable=False, max_digits=7, null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lorikeet", "0018_cart_totals"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cart",
+            name="revision",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
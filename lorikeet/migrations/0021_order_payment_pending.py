@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lorikeet", "0020_cart_updated_on"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="payment_pending",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lorikeet", "0021_order_payment_pending"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CheckoutAttempt",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("idempotency_key", models.CharField(max_length=255)),
+                (
+                    "status_code",
+                    models.PositiveSmallIntegerField(blank=True, null=True),
+                ),
+                ("response_body", models.TextField(blank=True)),
+                (
+                    "created_on",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+                (
+                    "cart",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="checkout_attempts",
+                        to="lorikeet.Cart",
+                    ),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="lorikeet.Order",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("cart", "idempotency_key")},
+            },
+        ),
+    ]
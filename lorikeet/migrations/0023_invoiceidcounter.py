@@ -0,0 +1,23 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lorikeet", "0022_checkoutattempt"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InvoiceIDCounter",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("next_value", models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.0.14 on 2026-10-18 17:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lorikeet", "0023_invoiceidcounter"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lineitem",
+            name="stored_total",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, editable=False, max_digits=7, null=True
+            ),
+        ),
+    ]
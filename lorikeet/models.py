@@ -1,13 +1,115 @@
-from decimal import Decimal
+from contextlib import contextmanager
 
 from django.conf import settings
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
 from django.urls import reverse
-from django.utils.module_loading import import_string
 from django.utils.timezone import now
 from model_utils.managers import InheritanceManager
 
-from . import exceptions, settings as lorikeet_settings
+from . import cart_checkers, events, exceptions, settings as lorikeet_settings
+from .async_support import resolve, resolve_all
+from .pricing import CartPricing
+from .query_hints import RelatedHints, get_cached_subclass, get_subclass, prefetch_hints
+
+CART_COMPLETE_CACHE_KEY_TPL = "au.com.cmv.open-source.lorikeet.cart-complete.{}.{}"
+
+
+def _cart_contents_changed(instance):
+    """Respond to a line item or adjustment being saved or deleted.
+
+    Discards the pricing snapshot of the cart instance cached on
+    ``instance`` (if it hasn't been loaded, there's no snapshot on it to
+    discard), bumps the revision of the cart it belongs to, and
+    recalculates its stored totals if ``LORIKEET_STORE_CART_TOTALS`` is
+    enabled.
+
+    If the cached cart instance is inside :meth:`Cart.defer_changes`, the
+    last two happen once at the end of that block instead.
+    """
+    if type(instance).cart.is_cached(instance):
+        cart = instance.cart
+        if cart is None:
+            return
+        cart.invalidate_pricing()
+        if getattr(cart, "_deferring_changes", False):
+            cart._changed_while_deferred = True
+            return
+    elif instance.cart_id is not None:
+        # Nothing is known about the cart but its ID, so bump its revision
+        # in the database without claiming to know the new value
+        carts = Cart.objects.filter(pk=instance.cart_id)
+        carts.bump_revision()
+        if lorikeet_settings.LORIKEET_STORE_CART_TOTALS:
+            # Adjustments can depend on the cart's user, address and so on,
+            # so they need to be priced against the real row, not a stub
+            cart = carts.first()
+            if cart is not None:
+                cart.update_totals(pricing=CartPricing(cart))
+        return
+    else:
+        return
+
+    cart.bump_revision()
+    if lorikeet_settings.LORIKEET_STORE_CART_TOTALS:
+        cart.update_totals(pricing=CartPricing(cart))
+
+
+def _selection_changed(field_name, pk, user_id):
+    """Respond to a delivery address or payment method being saved or deleted.
+
+    Bumps the revision of every cart that has the object with primary key
+    ``pk`` selected in ``field_name``, as well as every cart belonging to
+    ``user_id``, since they list all of that user's addresses and payment
+    methods.
+    """
+    query = models.Q(**{field_name: pk})
+    if user_id is not None:
+        query |= models.Q(user_id=user_id)
+    Cart.objects.filter(query).bump_revision()
+
+
+class CartQuerySet(models.QuerySet):
+    def bump_revision(self):
+        """Record that something in every cart in this queryset has changed.
+
+        See :meth:`Cart.bump_revision <lorikeet.models.Cart.bump_revision>`.
+        """
+        return self._update_and_notify(
+            revision=models.F("revision") + 1, updated_on=now()
+        )
+
+    def _update_and_notify(self, **kwargs):
+        # Only look up which carts are affected if someone's listening
+        cart_ids = ()
+        if events.get_bus().has_subscribers():
+            cart_ids = list(self.values_list("id", flat=True))
+        result = self.update(**kwargs)
+        for cart_id in cart_ids:
+            events.cart_changed(cart_id)
+        return result
+
+    def invalidate_totals(self):
+        """Discard the stored totals of every cart in this queryset.
+
+        They'll be recalculated the next time each cart is read. Use this
+        when something that affects pricing changes outside of the carts
+        themselves, e.g. when the price of a product changes::
+
+            Cart.objects.filter(
+                items__mylineitem__product=product
+            ).invalidate_totals()
+
+        This also bumps the revision of each cart, so clients holding an
+        outdated copy of it will load it again.
+        """
+        LineItem.objects.filter(cart__in=self.values("id")).update(stored_total=None)
+        return self._update_and_notify(
+            subtotal=None,
+            grand_total=None,
+            item_count=None,
+            revision=models.F("revision") + 1,
+        )
 
 
 class Cart(models.Model):
@@ -29,45 +131,316 @@ class Cart(models.Model):
         "lorikeet.PaymentMethod", blank=True, null=True, on_delete=models.PROTECT
     )
 
+    # Denormalized totals, only maintained if LORIKEET_STORE_CART_TOTALS is set
+    subtotal = models.DecimalField(
+        max_digits=7, decimal_places=2, blank=True, null=True, editable=False
+    )
+    grand_total = models.DecimalField(
+        max_digits=7, decimal_places=2, blank=True, null=True, editable=False
+    )
+    item_count = models.PositiveIntegerField(blank=True, null=True, editable=False)
+
+    # Incremented every time the cart or anything in it changes
+    revision = models.PositiveIntegerField(default=0, editable=False)
+    # When the revision last changed; used to find abandoned carts
+    updated_on = models.DateTimeField(default=now, db_index=True, editable=False)
+
+    objects = CartQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        self.updated_on = now()
+        if self.pk is None:
+            return super().save(*args, **kwargs)
+
+        # Increment the revision in the database rather than writing back
+        # whatever we loaded, so that concurrent changes always bump it
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = list(update_fields) + [
+                x for x in ("revision", "updated_on") if x not in update_fields
+            ]
+        revision = self.revision
+        self.revision = models.F("revision") + 1
+        try:
+            result = super().save(*args, **kwargs)
+        except Exception:
+            self.revision = revision
+            raise
+        self.revision = revision + 1
+        events.cart_changed(self.pk, self.revision)
+        return result
+
+    def bump_revision(self):
+        """Record that something in this cart has changed.
+
+        This happens automatically whenever the cart is saved, when a line
+        item or adjustment in it is saved or deleted, and when the delivery
+        address or payment method selected in it (or any belonging to its
+        user) is saved or deleted. You'll only need to call it if something
+        else that's shown in the cart changes; to do this for many carts at
+        once, use :meth:`CartQuerySet.bump_revision
+        <lorikeet.models.CartQuerySet.bump_revision>`.
+        """
+        if self.pk is not None:
+            self.updated_on = now()
+            Cart.objects.filter(pk=self.pk).update(
+                revision=models.F("revision") + 1, updated_on=self.updated_on
+            )
+            self.revision += 1
+            events.cart_changed(self.pk, self.revision)
+
+    @contextmanager
+    def defer_changes(self):
+        """Record changes to the contents of this cart once, at the end of a block.
+
+        Normally, saving or deleting a line item or adjustment bumps the
+        cart's revision, and recalculates its stored totals if
+        :data:`LORIKEET_STORE_CART_TOTALS` is enabled. Inside this block,
+        that happens once when the block ends instead of once per change,
+        as long as each line item or adjustment's ``cart`` is this
+        instance::
+
+            with transaction.atomic(), cart.defer_changes():
+                for item in items:
+                    item.cart = cart
+                    item.save()
+
+        If the block raises an exception, nothing is recorded, so use it
+        inside a transaction.
+        """
+        if getattr(self, "_deferring_changes", False):
+            yield
+            return
+        self._deferring_changes = True
+        self._changed_while_deferred = False
+        try:
+            yield
+        finally:
+            self._deferring_changes = False
+        if self._changed_while_deferred:
+            self.bump_revision()
+            if lorikeet_settings.LORIKEET_STORE_CART_TOTALS:
+                self.update_totals(pricing=CartPricing(self))
+
+    def add_items(self, items):
+        """Add line items to this cart, merging them with existing ones.
+
+        Items whose :meth:`~lorikeet.models.LineItem.get_merge_key`
+        matches that of an item of the same class already in the cart (or
+        earlier in ``items``) are merged into it with
+        :meth:`~lorikeet.models.LineItem.merge`, and deleted if they were
+        saved; the rest are saved to this cart. The cart's row is locked
+        for the rest of the transaction, so concurrent calls for the same
+        cart (even ones adding the first item with a key) wait for each
+        other rather than both adding a new row for the same key.
+
+        :param items: Line items to add, which may be unsaved, or saved
+            to another cart.
+        :type items: list
+        :return: The item in this cart that each of ``items`` ended up
+            in, in the same order.
+        :rtype: list
+        """
+        merged_into = {}
+        keys = [item.get_merge_key() for item in items]
+        exclude = [item.pk for item in items if item.pk is not None]
+        result = []
+
+        with transaction.atomic(), self.defer_changes():
+            models_to_merge = {
+                type(item) for item, key in zip(items, keys) if key is not None
+            }
+            if models_to_merge and self.pk is not None:
+                # Locking the existing items isn't enough, since there may
+                # not be any yet
+                Cart.objects.select_for_update().only("pk").get(pk=self.pk)
+            for model in models_to_merge:
+                existing = model.objects.filter(cart=self).exclude(pk__in=exclude)
+                for other in existing:
+                    other_key = other.get_merge_key()
+                    if other_key is not None:
+                        merged_into.setdefault((model, other_key), other)
+
+            for item, key in zip(items, keys):
+                target = None
+                if key is not None:
+                    target = merged_into.get((type(item), key))
+                if target is None:
+                    item.cart = self
+                    item.save()
+                    if key is not None:
+                        merged_into[(type(item), key)] = item
+                    result.append(item)
+                else:
+                    target.merge(item)
+                    # Share this instance, so the change is deferred
+                    target.cart = self
+                    target.save()
+                    if item.pk is not None:
+                        item.delete()
+                    result.append(target)
+        return result
+
+    def get_pricing(self, use_stored_totals=False):
+        """Get the pricing snapshot for this cart.
+
+        Returns a :class:`~lorikeet.pricing.CartPricing` instance, which is
+        built the first time this method is called and reused afterwards,
+        so that everything rendering the same cart instance (usually
+        ``request.get_cart()``) only prices it once.
+
+        Saving or deleting a line item or adjustment whose ``cart`` is this
+        instance discards the snapshot automatically; if you change the
+        cart some other way, call :meth:`invalidate_pricing`.
+
+        :param use_stored_totals: If this is ``True`` and
+            :data:`LORIKEET_STORE_CART_TOTALS` is enabled, a new snapshot
+            takes its subtotal from the stored totals (recalculating them
+            first if they've been discarded), so adjustments can be priced
+            without pricing every line item. Don't use this for anything
+            that's charged.
+        :type use_stored_totals: bool
+        """
+        if use_stored_totals and lorikeet_settings.LORIKEET_STORE_CART_TOTALS:
+            # If this recalculates the totals, it builds a snapshot itself
+            self.get_totals()
+            if not hasattr(self, "_pricing"):
+                self._pricing = CartPricing(self, subtotal=self.subtotal)
+        if not hasattr(self, "_pricing"):
+            self._pricing = CartPricing(self)
+        return self._pricing
+
+    def invalidate_pricing(self):
+        """Discard the snapshot returned by :meth:`get_pricing`."""
+        self.__dict__.pop("_pricing", None)
+
+    def get_totals(self):
+        """Get the subtotal, grand total and item count for this cart.
+
+        If the :data:`LORIKEET_STORE_CART_TOTALS` setting is enabled, this
+        returns the cart itself, whose ``subtotal``, ``grand_total`` and
+        ``item_count`` fields hold the stored totals (which are
+        recalculated first if they've been invalidated). Otherwise, it
+        returns the snapshot from :meth:`get_pricing`, which has attributes
+        with the same names.
+        """
+        if not lorikeet_settings.LORIKEET_STORE_CART_TOTALS:
+            return self.get_pricing()
+        if None in (self.subtotal, self.grand_total, self.item_count):
+            self.update_totals()
+        return self
+
+    def update_totals(self, pricing=None):
+        """Recalculate and store the totals for this cart.
+
+        This happens automatically whenever a line item or adjustment in
+        the cart is saved or deleted, so you'll only need to call it if
+        something else that affects pricing has changed; alternatively,
+        call :meth:`invalidate_totals` to have them recalculated the next
+        time they're needed.
+
+        :param pricing: The snapshot to take the totals from. Defaults to
+            the one returned by :meth:`get_pricing`.
+        :type pricing: lorikeet.pricing.CartPricing
+        """
+        if pricing is None:
+            pricing = self.get_pricing()
+        # Price the items themselves first, so their totals can be stored
+        # too, and the subtotal is guaranteed to be their sum
+        item_totals = pricing.item_totals
+        for item in pricing.items:
+            item.stored_total = item_totals[item.id]
+        self.subtotal = pricing.subtotal
+        self.grand_total = pricing.grand_total
+        self.item_count = pricing.item_count
+        if self.pk is not None:
+            Cart.objects.filter(pk=self.pk).update(
+                subtotal=self.subtotal,
+                grand_total=self.grand_total,
+                item_count=self.item_count,
+            )
+            if item_totals:
+                LineItem.objects.filter(id__in=item_totals).update(
+                    stored_total=models.Case(
+                        *(
+                            models.When(id=k, then=models.Value(v))
+                            for k, v in item_totals.items()
+                        ),
+                        output_field=LineItem._meta.get_field("stored_total"),
+                    )
+                )
+
+    def invalidate_totals(self):
+        """Discard the stored totals for this cart.
+
+        See :meth:`CartQuerySet.invalidate_totals
+        <lorikeet.models.CartQuerySet.invalidate_totals>`.
+        """
+        self.subtotal = self.grand_total = self.item_count = None
+        if self.pk is not None:
+            Cart.objects.filter(pk=self.pk).invalidate_totals()
+            self.revision += 1
+
     def get_subtotal(self):
         """Calculate the subtotal for this cart.
 
         This returns the sum of all of the item totals, but does not
         include any adjustments applied to the cart.
         """
-        return sum(
-            (x.get_total() for x in self.items.select_subclasses().all()), Decimal(0)
-        )
+        return CartPricing(self).subtotal
 
     def get_grand_total(self):
         """Calculate the grand total for this cart."""
-        subtotal = self.get_subtotal()
-        return subtotal + sum(
-            (x.get_total(subtotal) for x in self.adjustments.select_subclasses().all()),
-            Decimal(0),
-        )
+        return CartPricing(self).grand_total
+
+    def _get_selected_subclass(self, field_name):
+        """Get the subclass instance of the object selected in ``field_name``.
+
+        The instance is memoized until a different object is selected. If
+        it was loaded using
+        :func:`~lorikeet.query_hints.select_related_subclasses`, no
+        queries are needed at all.
+        """
+        field = self._meta.get_field(field_name)
+        selected_id = getattr(self, field.attname)
+        if selected_id is None:
+            return None
+
+        memo_attr = "_{}_subclass".format(field_name)
+        instance = getattr(self, memo_attr, None)
+        if instance is None or instance.id != selected_id:
+            instance = None
+            if field.is_cached(self):
+                instance = get_cached_subclass(getattr(self, field_name))
+                if instance is not None:
+                    prefetch_hints([instance])
+            if instance is None:
+                instance = get_subclass(
+                    field.related_model._default_manager.all(), id=selected_id
+                )
+            setattr(self, memo_attr, instance)
+        return instance
 
     @property
     def delivery_address_subclass(self):
         """Get the delivery address instance selected for this cart.
 
         Returns an instance of one of the registered
-        :class:`~lorikeet.models.DeliveryAddress` subclasses.
+        :class:`~lorikeet.models.DeliveryAddress` subclasses. The instance
+        is loaded once and reused until a different address is selected.
         """
-        if self.delivery_address_id is not None:
-            return DeliveryAddress.objects.get_subclass(id=self.delivery_address_id)
-        return None
+        return self._get_selected_subclass("delivery_address")
 
     @property
     def payment_method_subclass(self):
         """Get the payment method instance selected for this cart.
 
         Returns an instance of one of the registered
-        :class:`~lorikeet.models.PaymentMethod` subclasses.
+        :class:`~lorikeet.models.PaymentMethod` subclasses. The instance
+        is loaded once and reused until a different payment method is
+        selected.
         """
-        if self.payment_method_id is not None:
-            return PaymentMethod.objects.get_subclass(id=self.payment_method_id)
-        return None
+        return self._get_selected_subclass("payment_method")
 
     def is_complete(self, raise_exc=False, for_checkout=False):
         """Determine if this cart is able to be checked out.
@@ -76,6 +449,12 @@ class Cart(models.Model):
         be set to a :class:`~lorikeet.exceptions.IncompleteCartErrorSet`
         containing all of the reasons the cart cannot be checked out.
 
+        The result is reused until the cart's ``revision`` changes, and
+        if :data:`LORIKEET_CART_COMPLETE_CACHE_TIMEOUT` is set it's also
+        stored in the Django cache, so other requests for the same
+        revision of the cart can reuse it too. Checks made with
+        ``for_checkout`` set are never reused.
+
         :param raise_exc: If ``True`` and there are errors, raise the
             resulting :class:`~lorikeet.exceptions.IncompleteCartErrorSet`
             instead of just returning ``False``.
@@ -84,38 +463,40 @@ class Cart(models.Model):
         :rtype: bool
         """
 
-        # Use the .errors attribute to effectively memoize this function
-        if not hasattr(self, "errors"):
-            self.errors = exceptions.IncompleteCartErrorSet()
-
-            for checker in lorikeet_settings.LORIKEET_CART_COMPLETE_CHECKERS:
-                checker_func = import_string(checker)
-                try:
-                    checker_func(self)
-                except exceptions.IncompleteCartError as e:
-                    self.errors.add(e)
-
-            for item in self.items.all().select_subclasses():
-                try:
-                    item.check_complete(for_checkout)
-                except exceptions.IncompleteCartError as e:
-                    self.errors.add(e)
-
-            for adj in self.adjustments.all().select_subclasses():
-                try:
-                    adj.check_complete(for_checkout)
-                except exceptions.IncompleteCartError as e:
-                    self.errors.add(e)
+        if for_checkout:
+            # Checks made during checkout might lock rows, or otherwise
+            # depend on running inside the checkout transaction, so they
+            # are never reused
+            self.errors = cart_checkers.check_cart(self, for_checkout=True)
+            self._errors_revision = None
+        elif getattr(self, "_errors_revision", None) != self.revision:
+            self.errors = self._get_errors()
+            self._errors_revision = self.revision
 
         if raise_exc and self.errors:
             raise self.errors
 
         return not bool(self.errors)
 
+    def _get_errors(self):
+        timeout = lorikeet_settings.LORIKEET_CART_COMPLETE_CACHE_TIMEOUT
+        if not timeout or self.pk is None:
+            return cart_checkers.check_cart(self)
+
+        cache_key = CART_COMPLETE_CACHE_KEY_TPL.format(self.pk, self.revision)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return exceptions.IncompleteCartErrorSet(
+                exceptions.IncompleteCartError(**x) for x in cached
+            )
+
+        errors = cart_checkers.check_cart(self)
+        cache.set(cache_key, errors.to_json(), timeout)
+        return errors
+
 
 class Order(models.Model):
-    """A completed, paid order.
-    """
+    """A completed, paid order."""
 
     custom_invoice_id = models.CharField(
         max_length=255, blank=True, null=True, default=None, unique=True
@@ -132,6 +513,9 @@ class Order(models.Model):
     )
     grand_total = models.DecimalField(max_digits=7, decimal_places=2)
     purchased_on = models.DateTimeField(default=now)
+    #: Set while the payment for this order is being made, if
+    #: :data:`LORIKEET_TWO_PHASE_CHECKOUT` is enabled
+    payment_pending = models.BooleanField(default=False, editable=False)
 
     @property
     def email(self):
@@ -198,7 +582,40 @@ class Order(models.Model):
         return None
 
 
-class PaymentMethod(models.Model):
+class InvoiceIDCounter(models.Model):
+    """The next invoice ID to be allocated by a block invoice ID generator.
+
+    See :class:`lorikeet.invoice_ids.BlockInvoiceIDGenerator`.
+    """
+
+    name = models.CharField(max_length=255, primary_key=True)
+    next_value = models.BigIntegerField()
+
+
+class CheckoutAttempt(models.Model):
+    """The outcome of a checkout request made with an ``Idempotency-Key``.
+
+    Retrying the request with the same key gets the stored response back,
+    rather than checking out again. ``status_code`` is ``None`` while the
+    first request is still in progress.
+    """
+
+    cart = models.ForeignKey(
+        Cart, related_name="checkout_attempts", on_delete=models.CASCADE
+    )
+    idempotency_key = models.CharField(max_length=255)
+    order = models.ForeignKey(
+        Order, blank=True, null=True, related_name="+", on_delete=models.SET_NULL
+    )
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.TextField(blank=True)
+    created_on = models.DateTimeField(default=now, db_index=True)
+
+    class Meta:
+        unique_together = (("cart", "idempotency_key"),)
+
+
+class PaymentMethod(RelatedHints, models.Model):
     """A payment method, like a credit card or bank details.
 
     This model doesn't do anything by itself; you'll need to subclass it as
@@ -212,12 +629,41 @@ class PaymentMethod(models.Model):
 
     objects = InheritanceManager()
 
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        _selection_changed("payment_method", self.pk, self.user_id)
+        return result
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        _selection_changed("payment_method", pk, self.user_id)
+        return result
+
     def make_payment(self, order, amount):
+        """Charge ``amount`` to this payment method, for ``order``.
+
+        Subclasses need to override this, and return an instance of a
+        :class:`~lorikeet.models.Payment` subclass, or raise
+        :class:`~lorikeet.exceptions.PaymentError` if the payment fails.
+        It can also be implemented with ``async def``, which lets the
+        :doc:`async views </guides/async>` wait for the payment provider
+        without holding up a thread.
+        """
         raise NotImplementedError(
             "Provide a make_payment method in your "
             "PaymentMethod subclass {}.".format(self.__class__.__name__)
         )
 
+    def cancel_payment(self, payment):
+        """Reverse a payment made by :meth:`make_payment`.
+
+        This is only called if :data:`LORIKEET_TWO_PHASE_CHECKOUT` is
+        enabled, when ``payment`` was made successfully but the order
+        couldn't be finalised afterwards; subclasses should refund or
+        void it. By default it does nothing.
+        """
+
     def assign_to_user(self, user):
         self.user = user
 
@@ -226,7 +672,7 @@ class Payment(models.Model):
     method = models.ForeignKey(PaymentMethod, on_delete=models.PROTECT)
 
 
-class DeliveryAddress(models.Model):
+class DeliveryAddress(RelatedHints, models.Model):
     """An address that an order can be delivered to.
 
     This model doesn't do anything by itself; you'll need to subclass it as
@@ -244,8 +690,19 @@ class DeliveryAddress(models.Model):
 
     objects = InheritanceManager()
 
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        _selection_changed("delivery_address", self.pk, self.user_id)
+        return result
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        _selection_changed("delivery_address", pk, self.user_id)
+        return result
 
-class LineItem(models.Model):
+
+class LineItem(RelatedHints, models.Model):
     """An individual item that is either in a shopping cart or on an order.
 
     This model doesn't do anything by itself; you'll need to subclass it as
@@ -261,6 +718,11 @@ class LineItem(models.Model):
     total_when_charged = models.DecimalField(
         max_digits=7, decimal_places=2, blank=True, null=True
     )
+    # The total stored alongside the cart's, if LORIKEET_STORE_CART_TOTALS
+    # is enabled; None if it needs recalculating
+    stored_total = models.DecimalField(
+        max_digits=7, decimal_places=2, blank=True, null=True, editable=False
+    )
 
     objects = InheritanceManager()
 
@@ -279,7 +741,7 @@ class LineItem(models.Model):
         """
         if self.order_id:
             return self.total_when_charged
-        return self.get_total()
+        return resolve(self.get_total())
 
     def get_total(self):
         """Returns the total amount to charge on this LineItem.
@@ -290,16 +752,107 @@ class LineItem(models.Model):
         If you want to know the total for this line item from your own
         code, use the :func:`~lorikeet.models.LineItem.total` property
         rather than calling this function.
+
+        This can also be implemented with ``async def``, e.g. if the price
+        comes from a remote service; the totals for every item in the cart
+        are then awaited concurrently.
         """
         raise NotImplementedError(
             "Provide a get_total method in your LineItem "
             "subclass {}.".format(self.__class__.__name__)
         )
 
+    @classmethod
+    def get_total_expression(cls):
+        """Returns a query expression that calculates this line item's total.
+
+        By default this returns ``None``. Subclasses whose total can be
+        calculated entirely from database columns can override it to
+        return an expression relative to the subclass, for example::
+
+            @classmethod
+            def get_total_expression(cls):
+                return ExpressionWrapper(
+                    F('quantity') * F('product__unit_price'),
+                    output_field=DecimalField(max_digits=7, decimal_places=2),
+                )
+
+        :meth:`Cart.get_subtotal <lorikeet.models.Cart.get_subtotal>` will
+        then add up the totals of these line items in the database,
+        without loading them, when the items haven't already been loaded.
+        Nothing checks that the expression gives the same result as
+        :meth:`get_total`, so keep the two in sync; checkout always loads
+        the items and charges what :meth:`get_total` returns, so a
+        mismatch only affects the totals that are displayed.
+        """
+        return None
+
+    @classmethod
+    def get_totals_bulk(cls, items):
+        """Returns the totals to charge for several line items at once.
+
+        Lorikeet groups the items in a cart by their class, and calls this
+        method once per group rather than calling
+        :meth:`get_total` on each item. By default it just does the
+        latter; override it if your line items are priced using something
+        that's more efficient to look up in bulk, like an external price
+        book or a tiered pricing table.
+
+        :param items: The line items to price, all of which are instances
+            of this class.
+        :type items: list
+        :return: The totals for each of ``items``, in the same order.
+        :rtype: list[decimal.Decimal]
+
+        This can also be implemented with ``async def``.
+        """
+        return resolve_all(item.get_total() for item in items)
+
+    def get_merge_key(self):
+        """Returns a key identifying line items that can be combined.
+
+        By default this returns ``None``, and every line item added to a
+        cart gets its own row. If two items of the same class in a cart
+        would return the same (non-``None``) key, they're combined using
+        :meth:`merge` instead, both when an item is added through the API
+        and when a guest's cart is merged into a user's cart on login::
+
+            def get_merge_key(self):
+                return self.product_id
+
+        The key has to be hashable, and can only depend on this item's
+        own fields, not on which cart it's in.
+        """
+        return None
+
+    def merge(self, other):
+        """Combine ``other`` into this line item.
+
+        Subclasses that override :meth:`get_merge_key` need to override
+        this too, for example::
+
+            def merge(self, other):
+                self.quantity += other.quantity
+
+        This line item is saved afterwards, and ``other`` is deleted if
+        it had been saved.
+        """
+        raise NotImplementedError(
+            "Provide a merge method in your LineItem "
+            "subclass {}.".format(self.__class__.__name__)
+        )
+
     def save(self, *args, **kwargs):
         if self.order is not None and not getattr(self, "_new_order"):
             raise ValueError("Cannot modify a cart item attached to an order.")
-        return super().save(*args, **kwargs)
+        result = super().save(*args, **kwargs)
+        _cart_contents_changed(self)
+        return result
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        _cart_contents_changed(self)
+        return result
 
     def check_complete(self, for_checkout=False):
         """Checks that this line item is ready to be checked out.
@@ -339,10 +892,31 @@ class LineItem(models.Model):
         should ensure that those checks remain valid for the remainder
         of the database transaction (e.g. using
         `select_for_update <https://docs.djangoproject.com/en/1.10/ref/models/querysets/#select-for-update>`_).
+
+        If :data:`LORIKEET_TWO_PHASE_CHECKOUT` is enabled, the transaction
+        is committed before the payment method is charged, so instead of
+        relying on it being rolled back, undo anything this method does
+        in :meth:`cancel_checkout`.
         """
 
+    def cancel_checkout(self):
+        """Undo :meth:`prepare_for_checkout` after an unsuccessful payment.
 
-class Adjustment(models.Model):
+        This is only called if :data:`LORIKEET_TWO_PHASE_CHECKOUT` is
+        enabled, in a new transaction, once this item has been moved back
+        into the cart. By default it does nothing.
+        """
+
+    def complete_checkout(self):
+        """Finish checking out after a successful payment.
+
+        This is only called if :data:`LORIKEET_TWO_PHASE_CHECKOUT` is
+        enabled, in the transaction that finalises the order. By default
+        it does nothing.
+        """
+
+
+class Adjustment(RelatedHints, models.Model):
     """An adjustment to the total on a cart.
 
     Subclass this model only for adjustments that users can add to their carts
@@ -381,7 +955,17 @@ class Adjustment(models.Model):
         """
         if self.order_id:
             return self.total_when_charged
-        return self.get_total()
+        return resolve(self.get_total())
+
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        _cart_contents_changed(self)
+        return result
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        _cart_contents_changed(self)
+        return result
 
     def get_total(self, subtotal=None):
         """Returns the total adjustment to make to the cart.
@@ -444,4 +1028,25 @@ class Adjustment(models.Model):
         should ensure that those checks remain valid for the remainder
         of the database transaction (e.g. using
         `select_for_update <https://docs.djangoproject.com/en/1.10/ref/models/querysets/#select-for-update>`_).
+
+        If :data:`LORIKEET_TWO_PHASE_CHECKOUT` is enabled, the transaction
+        is committed before the payment method is charged, so instead of
+        relying on it being rolled back, undo anything this method does
+        in :meth:`cancel_checkout`.
+        """
+
+    def cancel_checkout(self):
+        """Undo :meth:`prepare_for_checkout` after an unsuccessful payment.
+
+        This is only called if :data:`LORIKEET_TWO_PHASE_CHECKOUT` is
+        enabled, in a new transaction, once this adjustment has been moved back
+        into the cart. By default it does nothing.
+        """
+
+    def complete_checkout(self):
+        """Finish checking out after a successful payment.
+
+        This is only called if :data:`LORIKEET_TWO_PHASE_CHECKOUT` is
+        enabled, in the transaction that finalises the order. By default
+        it does nothing.
         """
@@ -0,0 +1,139 @@
+from json import loads
+
+import pytest
+from shop import factories, models as smodels
+
+from . import models, settings as lorikeet_settings
+
+
+@pytest.fixture
+def store_totals(monkeypatch):
+    monkeypatch.setattr(lorikeet_settings, "LORIKEET_STORE_CART_TOTALS", True)
+
+
+@pytest.mark.django_db
+def test_totals_updated_on_item_save(store_totals, cart):
+    item = factories.MyLineItemFactory(cart=cart)
+    factories.CartDiscountFactory(cart=cart, percentage=10)
+
+    stored = models.Cart.objects.get(id=cart.id)
+    assert stored.subtotal == item.get_total()
+    assert stored.grand_total == cart.get_grand_total()
+    assert stored.item_count == 1
+
+    item.delete()
+    stored.refresh_from_db()
+    assert stored.subtotal == 0
+    assert stored.grand_total == 0
+    assert stored.item_count == 0
+
+
+@pytest.mark.django_db
+def test_totals_updated_on_uncached_item_save(store_totals, admin_cart, monkeypatch):
+    def get_total(self, subtotal):
+        # Only logged-in customers get the discount
+        return -self.percentage if self.cart.user_id else 0
+
+    monkeypatch.setattr(smodels.CartDiscount, "get_total", get_total)
+    item = factories.MyLineItemFactory(cart=admin_cart)
+    factories.CartDiscountFactory(cart=admin_cart, percentage=5)
+
+    smodels.MyLineItem.objects.get(id=item.id).save()
+    stored = models.Cart.objects.get(id=admin_cart.id)
+    assert stored.grand_total == stored.get_grand_total()
+    assert stored.grand_total == item.get_total() - 5
+
+
+@pytest.mark.django_db
+def test_totals_not_stored_by_default(cart):
+    factories.MyLineItemFactory(cart=cart)
+    stored = models.Cart.objects.get(id=cart.id)
+    assert stored.subtotal is None
+    assert stored.get_totals() is stored.get_pricing()
+
+
+@pytest.mark.django_db
+def test_invalidated_totals_recalculated_on_read(store_totals, client, cart):
+    item = factories.MyLineItemFactory(cart=cart)
+    item.product.unit_price += 1
+    item.product.save()
+    models.Cart.objects.filter(
+        items__mylineitem__product=item.product
+    ).invalidate_totals()
+    assert models.Cart.objects.get(id=cart.id).subtotal is None
+
+    data = loads(client.get("/_cart/").content.decode("utf-8"))
+    assert data["subtotal"] == str(item.get_total())
+    assert models.Cart.objects.get(id=cart.id).subtotal == item.get_total()
+
+
+@pytest.mark.django_db
+def test_serializer_reads_stored_totals(store_totals, client, cart):
+    factories.MyLineItemFactory(cart=cart)
+    models.Cart.objects.filter(id=cart.id).update(
+        subtotal="1.00", grand_total="2.00", item_count=3
+    )
+
+    data = loads(client.get("/_cart/").content.decode("utf-8"))
+    assert data["subtotal"] == "1.00"
+    assert data["grand_total"] == "2.00"
+    assert data["item_count"] == 3
+
+
+@pytest.mark.django_db
+def test_defer_changes(store_totals, cart):
+    revision = cart.revision
+    with cart.defer_changes():
+        factories.MyLineItemFactory(cart=cart)
+        factories.MyLineItemFactory(cart=cart)
+        stored = models.Cart.objects.get(id=cart.id)
+        assert stored.revision == revision
+        assert stored.item_count is None
+
+    stored.refresh_from_db()
+    assert stored.revision == revision + 1
+    assert stored.item_count == 2
+    assert stored.grand_total == cart.get_grand_total()
+
+
+@pytest.mark.django_db
+def test_defer_changes_skipped_on_error(store_totals, cart):
+    revision = cart.revision
+    with pytest.raises(ValueError):
+        with cart.defer_changes():
+            factories.MyLineItemFactory(cart=cart)
+            raise ValueError()
+    stored = models.Cart.objects.get(id=cart.id)
+    assert stored.revision == revision
+
+
+@pytest.mark.django_db
+def test_item_totals_stored(store_totals, client, cart, monkeypatch):
+    items = factories.MyLineItemFactory.create_batch(2, cart=cart)
+    factories.CartDiscountFactory(cart=cart, percentage=10)
+    expected = [str(x.get_total()) for x in items]
+    assert [str(x.stored_total) for x in models.LineItem.objects.all()] == expected
+
+    calls = []
+    get_total = smodels.MyLineItem.get_total
+    monkeypatch.setattr(
+        smodels.MyLineItem,
+        "get_total",
+        lambda self: calls.append(self) or get_total(self),
+    )
+    data = loads(client.get("/_cart/").content.decode("utf-8"))
+    assert [x["total"] for x in data["items"]] == expected
+    assert calls == []
+
+
+@pytest.mark.django_db
+def test_invalidated_item_totals_recalculated(store_totals, client, cart):
+    item = factories.MyLineItemFactory(cart=cart)
+    item.product.unit_price += 1
+    item.product.save()
+    models.Cart.objects.filter(id=cart.id).invalidate_totals()
+    assert models.LineItem.objects.get().stored_total is None
+
+    data = loads(client.get("/_cart/?fields=items").content.decode("utf-8"))
+    assert data["items"][0]["total"] == str(item.get_total())
+    assert models.LineItem.objects.get().stored_total == item.get_total()
@@ -1,5 +1,11 @@
+from unittest import mock
+
 import pytest
+from django.core.cache import cache
+from shop import factories
 
+from . import cart_checkers, models, settings as lorikeet_settings, signals
+from .conftest import fill_cart
 from .exceptions import IncompleteCartErrorSet
 
 
@@ -44,3 +50,94 @@ def test_raise_exc(cart):
 
     with pytest.raises(IncompleteCartErrorSet):
         cart.is_complete(raise_exc=True)
+
+
+@pytest.mark.django_db
+def test_checkers_not_imported_per_check(filled_cart):
+    with mock.patch.object(cart_checkers, "import_string") as import_mock:
+        assert filled_cart.is_complete()
+    import_mock.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_check_queries(django_assert_num_queries, filled_cart):
+    # One query each for line items and adjustments
+    with django_assert_num_queries(2):
+        assert filled_cart.is_complete()
+
+
+@pytest.mark.django_db
+def test_checker_timings(filled_cart):
+    handler = mock.Mock()
+    signals.cart_checked.connect(handler)
+    try:
+        filled_cart.is_complete()
+    finally:
+        signals.cart_checked.disconnect(handler)
+
+    handler.assert_called_once()
+    timings = handler.call_args[1]["timings"]
+    assert set(timings) == {
+        "lorikeet.cart_checkers.delivery_address_required",
+        "lorikeet.cart_checkers.payment_method_required",
+        "lorikeet.cart_checkers.cart_not_empty",
+        "lorikeet.cart_checkers.email_address_if_anonymous",
+        "MyLineItem.check_complete",
+        "CartDiscount.check_complete",
+    }
+    assert all(x >= 0 for x in timings.values())
+
+
+@pytest.mark.django_db
+def test_revision_bumped(cart):
+    revision = models.Cart.objects.get(id=cart.id).revision
+    item = factories.MyLineItemFactory(cart=cart)
+    assert cart.revision == revision + 1
+    item.delete()
+    cart.email = "someone@example.com"
+    cart.save()
+    assert cart.revision == revision + 3
+    assert models.Cart.objects.get(id=cart.id).revision == revision + 3
+
+
+@pytest.mark.django_db
+def test_result_reused_until_revision_changes(cart):
+    with mock.patch.object(
+        cart_checkers, "check_cart", wraps=cart_checkers.check_cart
+    ) as check_mock:
+        assert not cart.is_complete()
+        assert not cart.is_complete()
+        assert check_mock.call_count == 1
+
+        fill_cart(cart)
+        assert cart.is_complete()
+        assert check_mock.call_count == 2
+
+
+@pytest.mark.django_db
+def test_result_cached(monkeypatch, filled_cart):
+    monkeypatch.setattr(lorikeet_settings, "LORIKEET_CART_COMPLETE_CACHE_TIMEOUT", 60)
+    cache.clear()
+    assert filled_cart.is_complete()
+
+    other_instance = models.Cart.objects.get(id=filled_cart.id)
+    with mock.patch.object(cart_checkers, "check_cart") as check_mock:
+        assert other_instance.is_complete()
+    check_mock.assert_not_called()
+
+    factories.MyLineItemFactory(cart=other_instance)
+    with mock.patch.object(
+        cart_checkers, "check_cart", wraps=cart_checkers.check_cart
+    ) as check_mock:
+        assert other_instance.is_complete()
+    check_mock.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_checkout_never_reuses_result(filled_cart):
+    assert filled_cart.is_complete()
+    with mock.patch.object(
+        cart_checkers, "check_cart", wraps=cart_checkers.check_cart
+    ) as check_mock:
+        assert filled_cart.is_complete(for_checkout=True)
+    check_mock.assert_called_once_with(filled_cart, for_checkout=True)
@@ -0,0 +1,76 @@
+from unittest import mock
+
+import pytest
+from shop import factories, models as smodels
+
+from . import models
+
+
+@pytest.mark.django_db
+def test_add_items_merges_with_existing(cart):
+    existing = factories.MyLineItemFactory(cart=cart, quantity=2)
+    new = smodels.MyLineItem(product=existing.product, quantity=3)
+    assert cart.add_items([new]) == [existing]
+
+    assert cart.items.count() == 1
+    existing.refresh_from_db()
+    assert existing.quantity == 5
+    assert new.pk is None
+
+
+@pytest.mark.django_db
+def test_add_items_merges_within_list(cart):
+    product = factories.ProductFactory()
+    other = factories.ProductFactory()
+    items = [
+        smodels.MyLineItem(product=product, quantity=1),
+        smodels.MyLineItem(product=other, quantity=1),
+        smodels.MyLineItem(product=product, quantity=4),
+    ]
+    result = cart.add_items(items)
+    assert result == [items[0], items[1], items[0]]
+
+    assert cart.items.count() == 2
+    items[0].refresh_from_db()
+    assert items[0].quantity == 5
+
+
+@pytest.mark.django_db
+def test_add_items_bumps_revision_once(cart):
+    existing = factories.MyLineItemFactory(cart=cart)
+    cart.refresh_from_db()
+    revision = cart.revision
+    cart.add_items(
+        [
+            smodels.MyLineItem(product=existing.product, quantity=1),
+            smodels.MyLineItem(product=factories.ProductFactory(), quantity=1),
+        ]
+    )
+    cart.refresh_from_db()
+    assert cart.revision == revision + 1
+
+
+@pytest.mark.django_db
+def test_add_items_without_merge_key(cart, monkeypatch):
+    monkeypatch.setattr(smodels.MyLineItem, "get_merge_key", lambda self: None)
+    existing = factories.MyLineItemFactory(cart=cart, quantity=2)
+    cart.add_items([smodels.MyLineItem(product=existing.product, quantity=3)])
+
+    assert cart.items.count() == 2
+    existing.refresh_from_db()
+    assert existing.quantity == 2
+
+
+@pytest.mark.django_db
+def test_add_items_locks_cart(cart):
+    # Even when there are no existing items to lock
+    product = factories.ProductFactory()
+    with mock.patch.object(
+        models.CartQuerySet,
+        "select_for_update",
+        autospec=True,
+        side_effect=models.CartQuerySet.select_for_update,
+    ) as select_for_update:
+        cart.add_items([smodels.MyLineItem(product=product, quantity=1)])
+    select_for_update.assert_called_once()
+    assert cart.items.count() == 1
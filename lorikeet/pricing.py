@@ -0,0 +1,177 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Q, Sum, When
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.functional import cached_property
+
+from .async_support import resolve, resolve_all
+from .query_hints import get_subclass_paths, load_subclasses
+
+
+def price_items(items):
+    """Price a list of line items, grouped by class.
+
+    Each group is priced with a single call to
+    :meth:`~lorikeet.models.LineItem.get_totals_bulk`.
+
+    :return: A dictionary mapping line item IDs to their totals.
+    :rtype: dict
+    """
+    by_class = defaultdict(list)
+    for item in items:
+        by_class[type(item)].append(item)
+
+    totals = {}
+    for model, group in by_class.items():
+        group_totals = list(resolve(model.get_totals_bulk(group)))
+        if len(group_totals) != len(group):
+            raise ValueError(
+                "{}.get_totals_bulk() returned {} totals for {} items".format(
+                    model.__name__, len(group_totals), len(group)
+                )
+            )
+        totals.update(zip((item.id for item in group), group_totals))
+    return totals
+
+
+def prefix_expression(expression, prefix):
+    """Rewrite the field references in ``expression`` to start at ``prefix``.
+
+    This turns an expression written relative to a subclass into one that
+    can be evaluated against its base class, e.g. ``F('quantity')`` into
+    ``F('mylineitem__quantity')``.
+    """
+    if isinstance(expression, F):
+        return F(prefix + LOOKUP_SEP + expression.name)
+    expression = expression.copy()
+    expression.set_source_expressions(
+        [prefix_expression(x, prefix) for x in expression.get_source_expressions()]
+    )
+    return expression
+
+
+class CartPricing:
+    """A snapshot of the contents and totals of a cart.
+
+    The items and adjustments in the cart are each loaded at most once,
+    and every line item total, the subtotal and every adjustment total
+    are each calculated at most once, no matter how many times they're
+    read. Everything is loaded lazily, so building a snapshot is free
+    until something is actually read from it.
+
+    You'll usually want to get one of these from
+    :meth:`~lorikeet.models.Cart.get_pricing` rather than constructing it
+    yourself, so that it's shared with everything else that reads from
+    the same cart.
+
+    :param cart: The cart to price.
+    :type cart: lorikeet.models.Cart
+    :param subtotal: The subtotal, if it's already known (e.g. because
+        it's stored on the cart), so that the items don't need to be
+        priced to work it out.
+    :type subtotal: decimal.Decimal
+    """
+
+    def __init__(self, cart, subtotal=None):
+        self.cart = cart
+        if subtotal is not None:
+            self.__dict__["subtotal"] = subtotal
+
+    @cached_property
+    def items(self):
+        """All of the line items in the cart, as a tuple of subclass instances."""
+        if self.cart.pk is None:
+            return ()
+        return tuple(load_subclasses(self.cart.items.all()))
+
+    @cached_property
+    def adjustments(self):
+        """All of the adjustments on the cart, as a tuple of subclass instances."""
+        if self.cart.pk is None:
+            return ()
+        return tuple(load_subclasses(self.cart.adjustments.all()))
+
+    @cached_property
+    def item_count(self):
+        """The number of line items in the cart."""
+        if "items" in self.__dict__ or self.cart.pk is None:
+            return len(self.items)
+        return self.cart.items.count()
+
+    @cached_property
+    def item_totals(self):
+        """A dictionary mapping line item IDs to their totals.
+
+        Items are priced in groups using
+        :meth:`~lorikeet.models.LineItem.get_totals_bulk`, one group per
+        line item class.
+        """
+        return price_items(self.items)
+
+    @cached_property
+    def subtotal(self):
+        """The sum of all of the line item totals, excluding adjustments.
+
+        If the items in the cart haven't been loaded yet, and some of
+        their classes provide a
+        :meth:`~lorikeet.models.LineItem.get_total_expression`, the totals
+        for those items are added up by the database in a single query,
+        and only the remaining items are loaded and priced in Python. If
+        those expressions don't match the items' ``get_total()``, this
+        won't match :attr:`item_totals` either; read :attr:`items` first
+        if you need the two to agree, like checkout does.
+        """
+        if "items" in self.__dict__ or self.cart.pk is None:
+            return sum(self.item_totals.values(), Decimal(0))
+        return self._get_subtotal_from_database()
+
+    def _get_subtotal_from_database(self):
+        queryset = self.cart.items.select_subclasses()
+        paths = get_subclass_paths(queryset)
+
+        # Build a condition matching rows whose concrete class is each
+        # class that provides an expression, as opposed to a subclass of it
+        whens = []
+        for model, path in paths.items():
+            expression = model.get_total_expression()
+            if expression is None:
+                continue
+            condition = Q(**{path + "__isnull": False})
+            for other_path in paths.values():
+                if other_path.startswith(path + LOOKUP_SEP):
+                    condition &= Q(**{other_path + "__isnull": True})
+            whens.append(When(condition, then=prefix_expression(expression, path)))
+
+        if not whens:
+            return sum(self.item_totals.values(), Decimal(0))
+
+        output_field = DecimalField(max_digits=7, decimal_places=2)
+        database_total = self.cart.items.aggregate(
+            total=Sum(Case(*whens, output_field=output_field))
+        )["total"]
+
+        condition = Q()
+        for when in whens:
+            condition |= when.condition
+        remaining = load_subclasses(self.cart.items.exclude(condition))
+        return sum(price_items(remaining).values(), database_total or Decimal(0))
+
+    @cached_property
+    def adjustment_totals(self):
+        """A dictionary mapping adjustment IDs to their totals."""
+        totals = resolve_all(adj.get_total(self.subtotal) for adj in self.adjustments)
+        return dict(zip((adj.id for adj in self.adjustments), totals))
+
+    @cached_property
+    def grand_total(self):
+        """The subtotal plus the totals of all of the adjustments."""
+        return self.subtotal + sum(self.adjustment_totals.values(), Decimal(0))
+
+    def get_item_total(self, item):
+        """Get the total for a single line item in this cart."""
+        return self.item_totals[item.id]
+
+    def get_adjustment_total(self, adjustment):
+        """Get the total for a single adjustment on this cart."""
+        return self.adjustment_totals[adjustment.id]
@@ -0,0 +1,109 @@
+from unittest import mock
+
+import pytest
+from shop import factories, models as smodels
+
+from .pricing import CartPricing
+
+
+@pytest.mark.django_db
+def test_totals(filled_cart):
+    pricing = CartPricing(filled_cart)
+    items = list(filled_cart.items.select_subclasses())
+    adjustments = list(filled_cart.adjustments.select_subclasses())
+    subtotal = sum(x.get_total() for x in items)
+    assert pricing.subtotal == subtotal
+    assert pricing.grand_total == subtotal + sum(
+        x.get_total(subtotal) for x in adjustments
+    )
+    assert pricing.get_item_total(items[0]) == items[0].get_total()
+    assert pricing.get_adjustment_total(adjustments[0]) == adjustments[0].get_total(
+        subtotal
+    )
+
+
+@pytest.mark.django_db
+def test_cart_priced_once_per_request(client, filled_cart):
+    factories.CartDiscountFactory(cart=filled_cart)
+    factories.CartDiscountFactory(cart=filled_cart)
+    item_total = smodels.MyLineItem.get_total
+    adjustment_total = smodels.CartDiscount.get_total
+
+    with mock.patch.object(
+        smodels.MyLineItem, "get_total", autospec=True, side_effect=item_total
+    ) as item_mock, mock.patch.object(
+        smodels.CartDiscount,
+        "get_total",
+        autospec=True,
+        side_effect=adjustment_total,
+    ) as adjustment_mock:
+        resp = client.get("/_cart/")
+
+    assert resp.status_code == 200
+    assert item_mock.call_count == 2
+    assert adjustment_mock.call_count == 3
+
+
+@pytest.mark.django_db
+def test_snapshot_discarded_on_item_save(cart):
+    pricing = cart.get_pricing()
+    assert pricing.items == ()
+    assert cart.get_pricing() is pricing
+
+    factories.MyLineItemFactory(cart=cart)
+    assert cart.get_pricing() is not pricing
+    assert len(cart.get_pricing().items) == 1
+
+
+@pytest.mark.django_db
+def test_items_priced_in_bulk(cart):
+    items = [factories.MyLineItemFactory(cart=cart) for _ in range(3)]
+    totals_bulk = smodels.MyLineItem.get_totals_bulk
+
+    with mock.patch.object(
+        smodels.MyLineItem, "get_totals_bulk", side_effect=totals_bulk
+    ) as bulk_mock:
+        pricing = CartPricing(cart)
+        assert pricing.item_totals == {x.id: x.get_total() for x in items}
+
+    bulk_mock.assert_called_once()
+    assert bulk_mock.call_args[0][0] == items
+
+
+@pytest.mark.django_db
+def test_bulk_pricing_wrong_length(cart):
+    factories.MyLineItemFactory(cart=cart)
+
+    with mock.patch.object(smodels.MyLineItem, "get_totals_bulk", return_value=[]):
+        with pytest.raises(ValueError):
+            CartPricing(cart).item_totals
+
+
+@pytest.mark.django_db
+def test_subtotal_from_database(django_assert_num_queries, cart):
+    items = [factories.MyLineItemFactory(cart=cart) for _ in range(3)]
+
+    with mock.patch.object(smodels.MyLineItem, "get_total") as total_mock:
+        # One aggregate query, and one to load the items without expressions
+        with django_assert_num_queries(2):
+            subtotal = CartPricing(cart).subtotal
+
+    total_mock.assert_not_called()
+    assert subtotal == sum(x.get_total() for x in items)
+
+
+@pytest.mark.django_db
+def test_subtotal_without_expression(cart):
+    items = [factories.MyLineItemFactory(cart=cart) for _ in range(3)]
+
+    with mock.patch.object(
+        smodels.MyLineItem, "get_total_expression", return_value=None
+    ):
+        subtotal = CartPricing(cart).subtotal
+
+    assert subtotal == sum(x.get_total() for x in items)
+
+
+@pytest.mark.django_db
+def test_subtotal_from_database_empty_cart(cart):
+    assert CartPricing(cart).subtotal == 0
@@ -0,0 +1,156 @@
+from collections import defaultdict
+
+from django.db.models import prefetch_related_objects
+from django.db.models.constants import LOOKUP_SEP
+
+
+class RelatedHints:
+    """Lets subclasses of a model ask for related objects to be loaded with them.
+
+    :class:`~lorikeet.models.LineItem`, :class:`~lorikeet.models.Adjustment`,
+    :class:`~lorikeet.models.DeliveryAddress` and
+    :class:`~lorikeet.models.PaymentMethod` all inherit from this, and the
+    functions in this module read these attributes whenever Lorikeet loads
+    instances of their subclasses.
+    """
+
+    #: Related objects that subclasses need loaded alongside them, passed
+    #: to ``select_related()`` whenever Lorikeet loads instances of them.
+    select_related_hints = ()
+
+    #: Like :attr:`select_related_hints`, but passed to
+    #: ``prefetch_related()``, for many-to-many and reverse relations.
+    prefetch_related_hints = ()
+
+
+def get_subclass_paths(queryset):
+    """Map each subclass selected by ``queryset`` to its lookup path.
+
+    ``queryset`` must be the result of calling ``select_subclasses()`` on
+    an ``InheritanceQuerySet``; the paths are relative to its model.
+    """
+    paths = {}
+    for path in queryset.subclasses:
+        model = queryset.model
+        for part in path.split(LOOKUP_SEP):
+            model = model._meta.get_field(part).related_model
+        paths[model] = path
+    return paths
+
+
+def select_subclasses(queryset):
+    """Select subclasses of ``queryset``, along with their declared relations.
+
+    The ``select_related_hints`` of the queryset's model are applied as
+    they are, and those declared by each subclass are applied through the
+    path to that subclass.
+    """
+    base = queryset.model
+    queryset = queryset.select_subclasses()
+    lookups = list(base.select_related_hints)
+    for model, path in get_subclass_paths(queryset).items():
+        lookups += [
+            path + LOOKUP_SEP + hint
+            for hint in model.select_related_hints
+            if hint not in base.select_related_hints
+        ]
+    if lookups:
+        queryset = queryset.select_related(*lookups)
+    return queryset
+
+
+def prefetch_hints(instances):
+    """Prefetch the ``prefetch_related_hints`` of a list of instances.
+
+    The instances can be of mixed subclasses; each subclass's hints are
+    prefetched for the instances of that subclass.
+    """
+    by_class = defaultdict(list)
+    for instance in instances:
+        by_class[type(instance)].append(instance)
+    for model, group in by_class.items():
+        if model.prefetch_related_hints:
+            prefetch_related_objects(group, *model.prefetch_related_hints)
+    return instances
+
+
+def load_subclasses(queryset):
+    """Load ``queryset`` as a list of subclass instances.
+
+    Both the ``select_related_hints`` and ``prefetch_related_hints`` of
+    each subclass are applied.
+    """
+    return prefetch_hints(list(select_subclasses(queryset)))
+
+
+def get_subclass(queryset, **kwargs):
+    """Get a single subclass instance, like ``get_subclass()``.
+
+    Like :func:`load_subclasses`, this applies the hints declared by the
+    subclass.
+    """
+    instances = load_subclasses(queryset.filter(**kwargs))
+    if not instances:
+        raise queryset.model.DoesNotExist(
+            "{} matching query does not exist.".format(queryset.model._meta.object_name)
+        )
+    if len(instances) > 1:
+        raise queryset.model.MultipleObjectsReturned(
+            "get_subclass() returned more than one {}".format(
+                queryset.model._meta.object_name
+            )
+        )
+    return instances[0]
+
+
+def _get_all_subclass_paths(model):
+    return get_subclass_paths(model._default_manager.all().select_subclasses())
+
+
+def select_related_subclasses(queryset, *field_names):
+    """Select related objects, along with their subclasses and declared relations.
+
+    Each of ``field_names`` must be a foreign key to a model with an
+    ``InheritanceManager``. Instances loaded this way can be downcast
+    with :func:`get_cached_subclass` without any further queries.
+    """
+    lookups = []
+    for field_name in field_names:
+        model = queryset.model._meta.get_field(field_name).related_model
+        lookups.append(field_name)
+        lookups += [field_name + LOOKUP_SEP + x for x in model.select_related_hints]
+        for subclass, path in _get_all_subclass_paths(model).items():
+            prefix = field_name + LOOKUP_SEP + path
+            lookups.append(prefix)
+            lookups += [
+                prefix + LOOKUP_SEP + x
+                for x in subclass.select_related_hints
+                if x not in model.select_related_hints
+            ]
+    return queryset.select_related(*lookups)
+
+
+def get_cached_subclass(instance):
+    """Downcast ``instance`` using subclass rows loaded by ``select_related()``.
+
+    Returns ``None`` if the subclass rows weren't loaded along with it,
+    in which case the caller will need to query for the subclass instance.
+    """
+    paths = _get_all_subclass_paths(type(instance)).values()
+    found_any = False
+    for path in sorted(paths, key=len, reverse=True):
+        node = instance
+        for part in path.split(LOOKUP_SEP):
+            rel = type(node)._meta.get_field(part)
+            if not rel.is_cached(node):
+                node = None
+                break
+            found_any = True
+            node = rel.get_cached_value(node)
+            if node is None:
+                break
+        if node is not None:
+            return node
+    if paths and not found_any:
+        return None
+    return instance
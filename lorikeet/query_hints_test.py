@@ -0,0 +1,41 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from shop import factories, models as smodels
+
+from . import models
+from .query_hints import get_subclass, load_subclasses
+
+
+def count_cart_queries(client):
+    with CaptureQueriesContext(connection) as ctx:
+        assert client.get("/_cart/").status_code == 200
+    return len(ctx.captured_queries)
+
+
+@pytest.mark.django_db
+def test_cart_queries_constant(client, filled_cart):
+    queries = count_cart_queries(client)
+    for _ in range(5):
+        factories.MyLineItemFactory(cart=filled_cart)
+        factories.CartDiscountFactory(cart=filled_cart)
+    assert count_cart_queries(client) == queries
+
+
+@pytest.mark.django_db
+def test_hints_applied(django_assert_num_queries, cart):
+    factories.MyLineItemFactory(cart=cart)
+    factories.MyLineItemFactory(cart=cart)
+
+    with django_assert_num_queries(1):
+        items = load_subclasses(cart.items.all())
+        assert [type(x) for x in items] == [smodels.MyLineItem] * 2
+        assert all(x.product.name for x in items)
+
+
+@pytest.mark.django_db
+def test_get_subclass(cart):
+    item = factories.MyLineItemFactory(cart=cart)
+    assert get_subclass(models.LineItem.objects.all(), id=item.id) == item
+    with pytest.raises(models.LineItem.DoesNotExist):
+        get_subclass(models.LineItem.objects.all(), id=item.id + 1)
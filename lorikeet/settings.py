@@ -20,4 +20,28 @@ LORIKEET_SET_CSRFTOKEN_EVERYWHERE = getattr(
 
 LORIKEET_INVOICE_ID_GENERATOR = getattr(settings, "LORIKEET_INVOICE_ID_GENERATOR", None)
 
+LORIKEET_STORE_CART_TOTALS = getattr(settings, "LORIKEET_STORE_CART_TOTALS", False)
+
+LORIKEET_TWO_PHASE_CHECKOUT = getattr(settings, "LORIKEET_TWO_PHASE_CHECKOUT", False)
+
+LORIKEET_DEFER_HANDLERS = getattr(settings, "LORIKEET_DEFER_HANDLERS", False)
+
+LORIKEET_DEFERRED_EXECUTOR = getattr(
+    settings, "LORIKEET_DEFERRED_EXECUTOR", "lorikeet.deferred.ThreadPoolExecutor"
+)
+
+LORIKEET_CART_COMPLETE_CACHE_TIMEOUT = getattr(
+    settings, "LORIKEET_CART_COMPLETE_CACHE_TIMEOUT", None
+)
+
+LORIKEET_CART_DELTA_CACHE_TIMEOUT = getattr(
+    settings, "LORIKEET_CART_DELTA_CACHE_TIMEOUT", None
+)
+
+LORIKEET_CART_EVENTS = getattr(settings, "LORIKEET_CART_EVENTS", False)
+
+LORIKEET_CART_EVENT_BUS = getattr(
+    settings, "LORIKEET_CART_EVENT_BUS", "lorikeet.events.LocalEventBus"
+)
+
 order_url_signer = Signer(salt="au.com.cmv.open-source.lorikeet.order-url-signer")
@@ -2,6 +2,7 @@ from django.contrib.auth.signals import user_logged_in
 from django.dispatch import receiver
 
 from . import models
+from .query_hints import load_subclasses, select_related_subclasses
 
 
 @receiver(user_logged_in)
@@ -10,7 +11,9 @@ def merge_carts(sender, user, request, **kwargs):
     # there's nothing to merge.
     if "cart_id" in request.session:
         try:
-            session_cart = models.Cart.objects.get(id=request.session["cart_id"])
+            session_cart = select_related_subclasses(
+                models.Cart.objects.all(), "delivery_address", "payment_method"
+            ).get(id=request.session["cart_id"])
         except models.Cart.DoesNotExist:
             return
     else:
@@ -26,20 +29,18 @@ def merge_carts(sender, user, request, **kwargs):
         session_cart.save()
         request._cart = session_cart
     else:
-        # Now we have to merge things properly.
-        for item in session_cart.items.all():
-            # TODO: Some sort of check to see if items can be combined.
-            item.cart = user_cart
-            item.save()
+        # Now we have to merge things properly. Items that can be combined
+        # with one already in the user's cart are; the rest are moved.
+        user_cart.add_items(load_subclasses(session_cart.items.all()))
 
         if session_cart.delivery_address_id:
-            addr = session_cart.delivery_address
+            addr = session_cart.delivery_address_subclass
             addr.user = user
             addr.save()
             user_cart.delivery_address = addr
 
         if session_cart.payment_method_id:
-            method = session_cart.payment_method
+            method = session_cart.payment_method_subclass
             method.user = user
             method.save()
             user_cart.payment_method = method
@@ -1,4 +1,5 @@
 from django.contrib.sessions.middleware import SessionMiddleware
+from shop import factories
 
 from . import models, signal_handlers as handlers
 
@@ -64,3 +65,18 @@ def test_merge_filled_carts(admin_user, filled_admin_cart, filled_cart, rf):
     )
     assert filled_admin_cart.delivery_address_id == session_address_id
     assert filled_admin_cart.payment_method_id == session_payment_id
+
+
+def test_merge_carts_combines_items(admin_user, admin_cart, cart, rf):
+    user_item = factories.MyLineItemFactory(cart=admin_cart, quantity=2)
+    factories.MyLineItemFactory(cart=cart, product=user_item.product, quantity=3)
+    other_item = factories.MyLineItemFactory(cart=cart)
+    request = with_session(rf.post("/"))
+    request.session["cart_id"] = cart.id
+    handlers.merge_carts(sender=admin_user.__class__, user=admin_user, request=request)
+
+    assert admin_cart.items.count() == 2
+    user_item.refresh_from_db()
+    assert user_item.quantity == 5
+    other_item.refresh_from_db()
+    assert other_item.cart_id == admin_cart.id
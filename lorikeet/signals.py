@@ -1,3 +1,5 @@
 from django.dispatch import Signal
 
 order_checked_out = Signal(providing_args=["order", "request"])
+
+cart_checked = Signal(providing_args=["cart", "for_checkout", "timings"])
@@ -8,15 +8,19 @@ register = template.Library()
 
 
 @register.simple_tag(takes_context=True)
-def lorikeet_cart(context):
+def lorikeet_cart(context, fields=None):
     """Returns the current state of the user's cart.
 
     Returns a JSON string of the same shape as a response from
     :http:get:`/_cart/`. Requires that the current request be in the
     template's context.
+
+    :param fields: A comma-separated list of the fields to include, like
+        the ``fields`` query parameter of :http:get:`/_cart/`, e.g.
+        ``{% lorikeet_cart fields="item_count,grand_total" %}``.
     """
     cart = context["request"].get_cart()
     data = api_serializers.CartSerializer(
-        cart, context={"request": context["request"]}
+        cart, context={"request": context["request"]}, fields=fields
     ).data
     return dumps(data)
@@ -8,6 +8,7 @@ urlpatterns = [
     url(r"^$", api_views.CartView.as_view(), name="cart"),
     url(r"^(?P<id>\d+)/$", api_views.CartItemView.as_view(), name="cart-item"),
     url(r"^new/$", api_views.AddToCartView.as_view(), name="add-to-cart"),
+    url(r"^new-bulk/$", api_views.BulkAddToCartView.as_view(), name="add-to-cart-bulk"),
     url(
         r"^address/(?P<id>\d+)/$",
         api_views.DeliveryAddressView.as_view(),
@@ -34,5 +35,7 @@ urlpatterns = [
         api_views.NewAdjustmentView.as_view(),
         name="new-adjustment",
     ),
+    url(r"^events/$", api_views.CartEventsView.as_view(), name="events"),
+    url(r"^batch/$", api_views.BatchView.as_view(), name="batch"),
     url(r"^checkout/$", api_views.CheckoutView.as_view(), name="checkout"),
 ]
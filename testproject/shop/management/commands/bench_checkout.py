@@ -0,0 +1,272 @@
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from json import dumps
+from logging import getLogger
+from math import ceil
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.db.models import Count, Sum
+from django.test import Client
+from lorikeet import models, settings as lorikeet_settings
+
+from ... import models as smodels
+
+Result = namedtuple("Result", ("latency", "outcome", "retries", "deadlocks"))
+
+SCENARIOS = ("distinct", "same-cart", "hot-stock")
+
+
+def is_deadlock(error):
+    # Postgres reports deadlocks as SQLSTATE 40P01, MySQL as error 1213
+    code = getattr(error.__cause__, "pgcode", None)
+    return code == "40P01" or "deadlock" in str(error).lower()
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list."""
+    return values[max(0, ceil(p / 100 * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Check out carts concurrently through the checkout endpoint, and report "
+        "throughput, latency, retries and deadlocks. The carts are created in "
+        "the configured database first, so run this against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--checkouts",
+            type=int,
+            default=100,
+            help="Number of checkout requests to make (default 100).",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=10,
+            help="Number of checkout requests to make at once (default 10).",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0,
+            help="Milliseconds that each payment takes (default 0).",
+        )
+        parser.add_argument(
+            "--scenario",
+            choices=SCENARIOS,
+            default="distinct",
+            help=(
+                "distinct: every request checks out a different cart. "
+                "same-cart: every cart is submitted twice at once. "
+                "hot-stock: every cart contains the same stock-tracked product."
+            ),
+        )
+        parser.add_argument(
+            "--items",
+            type=int,
+            default=3,
+            help="Number of line items in each cart (default 3).",
+        )
+        parser.add_argument(
+            "--retries",
+            type=int,
+            default=3,
+            help=(
+                "Number of times to retry a checkout that fails with a database "
+                "error, like a deadlock or lock timeout (default 3)."
+            ),
+        )
+        parser.add_argument(
+            "--two-phase",
+            action="store_true",
+            help="Enable LORIKEET_TWO_PHASE_CHECKOUT.",
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print the report as JSON."
+        )
+
+    def handle(self, **options):
+        self.retries = options["retries"]
+        carts, hot_product = self.create_carts(
+            options["scenario"], options["checkouts"], options["items"]
+        )
+        stock_before = hot_product.stock if hot_product else None
+
+        old_latency = smodels.PipeCard.latency
+        old_two_phase = lorikeet_settings.LORIKEET_TWO_PHASE_CHECKOUT
+        smodels.PipeCard.latency = options["latency"] / 1000
+        lorikeet_settings.LORIKEET_TWO_PHASE_CHECKOUT = options["two_phase"]
+        # Failed checkouts are counted in the report, rather than logged
+        request_logger = getLogger("django.request")
+        request_logger.disabled = True
+        try:
+            started = perf_counter()
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+                results = list(pool.map(self.checkout, carts))
+            elapsed = perf_counter() - started
+        finally:
+            request_logger.disabled = False
+            smodels.PipeCard.latency = old_latency
+            lorikeet_settings.LORIKEET_TWO_PHASE_CHECKOUT = old_two_phase
+
+        report = self.make_report(options, carts, results, elapsed)
+        if hot_product is not None:
+            hot_product.refresh_from_db()
+            sold = smodels.MyLineItem.objects.filter(
+                order__isnull=False, product=hot_product
+            ).aggregate(sold=Sum("quantity"))["sold"]
+            # Should always be zero; anything else is a lost update
+            report["stock_drift"] = stock_before - (sold or 0) - hot_product.stock
+
+        if options["json"]:
+            self.stdout.write(dumps(report, indent=2))
+        else:
+            self.write_report(report)
+
+    def create_carts(self, scenario, checkouts, items):
+        """Create carts ready for checkout.
+
+        Returns the ID of the cart each checkout should use, and the
+        product whose stock is contended, if any.
+        """
+        hot_product = None
+        if scenario == "hot-stock":
+            hot_product = smodels.Product.objects.create(
+                name="Hot product",
+                unit_price=Decimal("10.00"),
+                stock=checkouts * 10,
+            )
+
+        cart_count = ceil(checkouts / 2) if scenario == "same-cart" else checkouts
+        cart_ids = []
+        for _ in range(cart_count):
+            cart = models.Cart.objects.create(
+                delivery_address=smodels.AustralianDeliveryAddress.objects.create(
+                    addressee="Bench Mark",
+                    address="1 Test Street",
+                    suburb="Adelaide",
+                    state="SA",
+                    postcode="5000",
+                ),
+                payment_method=smodels.PipeCard.objects.create(card_id="Visa4242"),
+            )
+            # Identifies the cart each order came from
+            cart.email = "bench-{}@example.com".format(cart.id)
+            cart.save()
+            products = [
+                smodels.Product.objects.create(
+                    name="Product", unit_price=Decimal("10.00")
+                )
+                for _ in range(items)
+            ]
+            if hot_product is not None:
+                products[0] = hot_product
+            cart.add_items(
+                [smodels.MyLineItem(product=p, quantity=1) for p in products]
+            )
+            cart_ids.append(cart.id)
+
+        if scenario == "same-cart":
+            # Submit each cart twice in a row, so both land at the same time
+            cart_ids = [x for x in cart_ids for _ in range(2)][:checkouts]
+        return cart_ids, hot_product
+
+    def checkout(self, cart_id):
+        client = Client(HTTP_HOST="localhost")
+        session = client.session
+        session["cart_id"] = cart_id
+        session.save()
+
+        retries = deadlocks = 0
+        started = perf_counter()
+        try:
+            while True:
+                try:
+                    resp = client.post(
+                        "/_cart/checkout/", "{}", content_type="application/json"
+                    )
+                except OperationalError as e:
+                    if is_deadlock(e):
+                        deadlocks += 1
+                    if retries == self.retries:
+                        outcome = type(e).__name__
+                        break
+                    retries += 1
+                except Exception as e:  # pylint: disable = broad-except
+                    outcome = type(e).__name__
+                    break
+                else:
+                    outcome = str(resp.status_code)
+                    break
+        finally:
+            connections.close_all()
+        return Result(perf_counter() - started, outcome, retries, deadlocks)
+
+    def make_report(self, options, carts, results, elapsed):
+        latencies = sorted(x.latency * 1000 for x in results)
+        orders_per_cart = (
+            models.Order.objects.filter(
+                guest_email__in=["bench-{}@example.com".format(x) for x in set(carts)]
+            )
+            .values("guest_email")
+            .annotate(count=Count("id"))
+        )
+        return {
+            "scenario": options["scenario"],
+            "checkouts": len(results),
+            "concurrency": options["concurrency"],
+            "payment_latency_ms": options["latency"],
+            "two_phase": options["two_phase"],
+            "elapsed_s": elapsed,
+            "throughput": len(results) / elapsed if elapsed else 0,
+            "latency_ms": {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": latencies[-1],
+            },
+            "outcomes": dict(Counter(x.outcome for x in results)),
+            "retries": sum(x.retries for x in results),
+            "deadlocks": sum(x.deadlocks for x in results),
+            # Can be more than the 200 outcomes, if a request failed after
+            # its checkout was committed (e.g. while saving the session)
+            "orders": sum(x["count"] for x in orders_per_cart),
+            # Should always be zero; a cart can only be checked out once
+            "duplicate_orders": sum(x["count"] - 1 for x in orders_per_cart),
+        }
+
+    def write_report(self, report):
+        self.stdout.write(
+            "{scenario}: {checkouts} checkouts, concurrency {concurrency}, "
+            "{payment_latency_ms:g}ms payment latency{mode}".format(
+                mode=", two-phase" if report["two_phase"] else "", **report
+            )
+        )
+        self.stdout.write(
+            "Throughput: {throughput:.1f} checkouts/s ({elapsed_s:.2f}s)".format(
+                **report
+            )
+        )
+        self.stdout.write(
+            "Latency: p50 {p50:.1f}ms, p95 {p95:.1f}ms, p99 {p99:.1f}ms, "
+            "max {max:.1f}ms".format(**report["latency_ms"])
+        )
+        self.stdout.write(
+            "Outcomes: {}".format(
+                ", ".join(
+                    "{} x {}".format(k, v)
+                    for k, v in sorted(report["outcomes"].items())
+                )
+            )
+        )
+        self.stdout.write(
+            "Orders: {orders}, duplicate orders: {duplicate_orders}".format(**report)
+        )
+        self.stdout.write("Retries: {retries}, deadlocks: {deadlocks}".format(**report))
+        if "stock_drift" in report:
+            self.stdout.write("Stock drift: {stock_drift}".format(**report))
@@ -0,0 +1,41 @@
+from io import StringIO
+from json import loads
+
+import pytest
+from django.core.management import call_command
+
+
+@pytest.fixture(autouse=True)
+def allowed_hosts(settings):
+    # The command makes its requests to localhost, which is only allowed by
+    # default when DEBUG is on
+    settings.ALLOWED_HOSTS = ["localhost"]
+
+
+def bench(**kwargs):
+    out = StringIO()
+    call_command("bench_checkout", json=True, stdout=out, **kwargs)
+    return loads(out.getvalue())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bench_checkout():
+    report = bench(checkouts=4, concurrency=1)
+    assert report["outcomes"] == {"200": 4}
+    assert report["orders"] == 4
+    assert report["duplicate_orders"] == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bench_checkout_same_cart():
+    report = bench(checkouts=4, concurrency=1, scenario="same-cart")
+    assert report["outcomes"] == {"200": 2, "422": 2}
+    assert report["orders"] == 2
+    assert report["duplicate_orders"] == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bench_checkout_hot_stock():
+    report = bench(checkouts=4, concurrency=1, scenario="hot-stock", two_phase=True)
+    assert report["outcomes"] == {"200": 4}
+    assert report["stock_drift"] == 0
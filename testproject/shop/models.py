@@ -1,7 +1,9 @@
 from decimal import ROUND_DOWN, Decimal
+from time import sleep
 
 from django.db import models
-from lorikeet.exceptions import PaymentError
+from django.db.models import ExpressionWrapper, F
+from lorikeet.exceptions import IncompleteCartError, PaymentError
 from lorikeet.models import (
     Adjustment,
     DeliveryAddress,
@@ -25,15 +27,55 @@ AUSTRALIAN_STATES = (
 class Product(models.Model):
     name = models.CharField(max_length=255)
     unit_price = models.DecimalField(max_digits=7, decimal_places=2)
+    # None means the product is never out of stock
+    stock = models.PositiveIntegerField(blank=True, null=True)
 
 
 class MyLineItem(LineItem):
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.PositiveSmallIntegerField()
 
+    select_related_hints = ("product",)
+
     def get_total(self):
         return self.quantity * self.product.unit_price
 
+    def get_merge_key(self):
+        return self.product_id
+
+    def merge(self, other):
+        self.quantity += other.quantity
+
+    def check_complete(self, for_checkout=False):
+        if self.product.stock is None:
+            return
+        products = Product.objects.filter(id=self.product_id)
+        if for_checkout:
+            products = products.select_for_update()
+        if products.values_list("stock", flat=True).get() < self.quantity:
+            raise IncompleteCartError(
+                "out_of_stock", "{} is out of stock.".format(self.product.name)
+            )
+
+    def prepare_for_checkout(self):
+        if self.product.stock is not None:
+            Product.objects.filter(id=self.product_id).update(
+                stock=F("stock") - self.quantity
+            )
+
+    def cancel_checkout(self):
+        if self.product.stock is not None:
+            Product.objects.filter(id=self.product_id).update(
+                stock=F("stock") + self.quantity
+            )
+
+    @classmethod
+    def get_total_expression(cls):
+        return ExpressionWrapper(
+            F("quantity") * F("product__unit_price"),
+            output_field=models.DecimalField(max_digits=7, decimal_places=2),
+        )
+
 
 class AustralianDeliveryAddress(DeliveryAddress):
     addressee = models.CharField(max_length=255)
@@ -46,7 +88,12 @@ class AustralianDeliveryAddress(DeliveryAddress):
 class PipeCard(PaymentMethod):
     card_id = models.CharField(max_length=30)
 
+    #: Seconds to wait in make_payment, to stand in for a real provider
+    latency = 0
+
     def make_payment(self, order, amount):
+        if self.latency:
+            sleep(self.latency)
         if self.card_id.endswith("9"):
             raise PaymentError("Insufficient funds")
         return PipePayment.objects.create(method=self, amount=amount)